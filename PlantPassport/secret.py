@@ -8,3 +8,5 @@ class Secret:
     AWS_ACCESS_KEY_ID = ''
     AWS_SECRET_ACCESS_KEY = ''
 
+    # Shared cache, e.g. '127.0.0.1:11211'
+    MEMCACHED_LOCATION = ''
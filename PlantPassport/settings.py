@@ -182,6 +182,35 @@ IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY = 'imagekit.cachefiles.strategies.Optimistic
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Cache: local memory of the process in development, shared memcached in production
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if getattr(Secret, 'MEMCACHED_LOCATION', ''):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': Secret.MEMCACHED_LOCATION,
+    }
+
+# Attribute schema version (see plants/schema.py) is read from the database once per this number of seconds
+PLANT_SCHEMA_CHECK_INTERVAL = 1
+
+# Plant state snapshot is saved after this number of logs
+PLANT_SNAPSHOT_INTERVAL = 50
+
+# Number of plants on a page of plant list
+PLANT_LIST_PAGE_SIZE = 100
+
+# Number of logs on a page of plant timeline
+PLANT_TIMELINE_PAGE_SIZE = 20
+
+# File of write-behind spool for care events (disabled if empty), see plants/spool.py
+# and `flush_log_spool` command
+PLANT_LOG_SPOOL = None
+
+
 # Auth
 AUTH_USER_MODEL = 'users.User'
 
@@ -1,3 +1,4 @@
+from django.utils import formats, timezone
 from plants.models import Plant
 from users.models import User
 from rest_framework import serializers
@@ -21,4 +22,20 @@ class PlantSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username')
\ No newline at end of file
+        fields = ('id', 'username')
+
+class LogCardSerializer(serializers.Serializer):
+    """Card of plant timeline, see LogForCard"""
+    id = serializers.IntegerField()
+    action_time = serializers.DateTimeField()
+    action_time_display = serializers.SerializerMethodField()
+    title = serializers.CharField()
+    subtitle = serializers.CharField()
+    img_url = serializers.CharField()
+    img_alt = serializers.CharField()
+    text = serializers.CharField()
+    attrs = serializers.DictField()
+
+    def get_action_time_display(self, card):
+        """Same format as in template"""
+        return formats.date_format(timezone.localtime(card.action_time), 'DATETIME_FORMAT')
@@ -1,3 +1,93 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from plants.models import Log, Plant
+from plants.services import create_new_plant, create_log
+from plants.summaries import get_summary_version
+from users.models import User
 
-# Create your tests here.
+
+class PlantAccessTests(TestCase):
+    """Plants API: everybody reads visible plants, only owner changes them"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.friend = User.objects.create_user('friend', password='pw')
+        self.stranger = User.objects.create_user('stranger', password='pw')
+        self.owner.friends.add(self.friend)
+
+        self.plants = {}
+        for access_type in Plant.AccessTypeChoices:
+            plant = create_new_plant(self.owner)
+            plant.access_type = access_type
+            plant.save()
+            create_log(Log.ActionChoices.ADDITION, self.owner, plant, {'owner': self.owner.id, 'genus': 'Lithops'})
+            self.plants[access_type] = plant
+
+    def get_client(self, user):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def get_users(self):
+        return {'anonymous': None, 'stranger': self.stranger, 'friend': self.friend, 'owner': self.owner}
+
+    def can_view(self, user_name, access_type):
+        if access_type == Plant.AccessTypeChoices.PUBLIC or user_name == 'owner':
+            return True
+        return access_type == Plant.AccessTypeChoices.FRIENDS and user_name == 'friend'
+
+    def test_read(self):
+        for user_name, user in self.get_users().items():
+            client = self.get_client(user)
+            visible_ids = {plant['id'] for plant in client.get('/api/plants/').json()['results']}
+            for access_type, plant in self.plants.items():
+                with self.subTest(user=user_name, access_type=access_type.label):
+                    response = client.get(f'/api/plants/{plant.id}/')
+                    can_view = self.can_view(user_name, access_type)
+                    self.assertEqual(response.status_code == 200, can_view)
+                    self.assertEqual(plant.id in visible_ids, can_view)
+
+    def test_update(self):
+        for user_name, user in self.get_users().items():
+            client = self.get_client(user)
+            for access_type, plant in self.plants.items():
+                with self.subTest(user=user_name, access_type=access_type.label):
+                    summary_version = get_summary_version(self.owner.id)
+                    with self.captureOnCommitCallbacks(execute=True):
+                        response = client.patch(f'/api/plants/{plant.id}/', {'is_seed': True}, format='json')
+                    plant.refresh_from_db()
+                    if user_name == 'owner':
+                        self.assertEqual(response.status_code, 200)
+                        self.assertTrue(plant.is_seed)
+                        self.assertNotEqual(get_summary_version(self.owner.id), summary_version)
+                        Plant.objects.filter(id=plant.id).update(is_seed=False)
+                    else:
+                        self.assertIn(response.status_code, (401, 403, 404))
+                        self.assertFalse(plant.is_seed)
+
+    def test_delete(self):
+        for user_name, user in self.get_users().items():
+            client = self.get_client(user)
+            for access_type, plant in self.plants.items():
+                if user_name == 'owner':
+                    continue
+                with self.subTest(user=user_name, access_type=access_type.label):
+                    response = client.delete(f'/api/plants/{plant.id}/')
+                    self.assertIn(response.status_code, (401, 403, 404))
+                    self.assertTrue(Plant.objects.filter(id=plant.id).exists())
+
+        plant = self.plants[Plant.AccessTypeChoices.PRIVATE]
+        summary_version = get_summary_version(self.owner.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.get_client(self.owner).delete(f'/api/plants/{plant.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Plant.objects.filter(id=plant.id).exists())
+        self.assertNotEqual(get_summary_version(self.owner.id), summary_version)
+
+    def test_create(self):
+        for user_name, user in self.get_users().items():
+            with self.subTest(user=user_name):
+                response = self.get_client(user).post('/api/plants/', {'uid': '123456'}, format='json')
+                self.assertIn(response.status_code, (401, 403, 405))
+        self.assertFalse(Plant.objects.filter(uid='123456').exists())
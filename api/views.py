@@ -3,7 +3,7 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets
 from rest_framework import permissions
 
-from .serializers import PlantSerializer
+from .serializers import PlantSerializer, LogCardSerializer
 
 # from rest_framework.views import APIView
 # from rest_framework.response import Response
@@ -13,20 +13,48 @@ from rest_framework.response import Response
 
 from taggit.models import Tag
 
-from plants.services import check_is_user_owner_of_plant
-from plants.entities import RichPlant
+from plants.permissions import get_plant_permissions
+from plants.summaries import invalidate_user_summaries
+from plants.services import get_plant_timeline_page
 from plants.models import Plant
 from users.models import User
 
 
 
+class PlantAccess(permissions.BasePermission):
+    """Plants are read by users who can see them and changed only by owners"""
+
+    def has_permission(self, request, view):
+        return request.method in permissions.SAFE_METHODS or request.user.is_authenticated
+
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return get_plant_permissions(request).can_view(obj)
+        return get_plant_permissions(request).can_edit(obj)
+
+
 class PlantViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows Plants to be viewed or edited.
+    Plants are created only with the form: new plant needs owner and first log.
     """
     queryset = Plant.objects.all().order_by('-creation_date')
     serializer_class = PlantSerializer
-    #permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [PlantAccess]
+    http_method_names = ['get', 'put', 'patch', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return get_plant_permissions(self.request).visible_plants().order_by('-creation_date')
+
+    def perform_update(self, serializer):
+        # seeds and access type are shown in collection summaries
+        serializer.save()
+        invalidate_user_summaries(get_plant_permissions(self.request).get_owner_id(serializer.instance))
+
+    def perform_destroy(self, instance):
+        owner_id = get_plant_permissions(self.request).get_owner_id(instance)
+        instance.delete()
+        invalidate_user_summaries(owner_id)
 
 
 
@@ -48,9 +76,9 @@ def add_existing_tag_to_plant(request, plant_id: int, tag_id: int):
     current_user = request.user
     tag = Tag.objects.get(id = tag_id)
     target_plant = get_object_or_404(Plant, id=plant_id)
-    rich_plant = RichPlant(target_plant)
-    if check_is_user_owner_of_plant(current_user, rich_plant):
+    if get_plant_permissions(request).can_edit(target_plant):
         target_plant.tags.add(tag.name)
+        invalidate_user_summaries(current_user.id)
         return Response({"message": "Tag %s was added successfully" % tag})
 
 @api_view(['POST'])
@@ -69,11 +97,10 @@ def create_new_tag(request):
     else:
         return Response({"message": "No tag was received!"})
 
-    rich_plant = RichPlant(target_plant)
-
-    if check_is_user_owner_of_plant(current_user, rich_plant):
+    if get_plant_permissions(request).can_edit(target_plant):
         new_tag = new_tag.strip()
         target_plant.tags.add(new_tag)
+        invalidate_user_summaries(current_user.id)
         #print(new_tag, 'created')
         return Response({"message": "Tag %s was created successfully" % new_tag})
     else:
@@ -84,10 +111,10 @@ def create_new_tag(request):
 def remove_tag_from_plant(request, plant_id: int, tag_id: int):
     current_user = request.user
     target_plant = get_object_or_404(Plant, id=plant_id)
-    rich_plant = RichPlant(target_plant)
-    if check_is_user_owner_of_plant(current_user, rich_plant):
+    if get_plant_permissions(request).can_edit(target_plant):
         tag = Tag.objects.get(id = tag_id)
         target_plant.tags.remove(tag.name)
+        invalidate_user_summaries(current_user.id)
         return Response({"message": "Tag %s was removed successfully" % tag.name})
     else: 
         return Response({"message": "You are not the owner of the plant" })
@@ -97,20 +124,41 @@ def remove_tag_from_plant(request, plant_id: int, tag_id: int):
 @permission_classes((permissions.AllowAny,))
 def get_plant_tags(request, plant_id: int):
     target_plant = get_object_or_404(Plant, id=plant_id)
+    if not get_plant_permissions(request).can_view(target_plant):
+        return Response({"message": "You can't see the plant"}, status=403)
     return Response(target_plant.tags.all().values())
 
 
+@api_view(['GET'])
+@permission_classes((permissions.AllowAny,))
+def get_plant_timeline(request, plant_id: int):
+    """Page of plant timeline (newest first) after `cursor` of the previous page"""
+    target_plant = get_object_or_404(Plant, id=plant_id)
+    if not get_plant_permissions(request).can_view(target_plant):
+        return Response({"message": "You can't see the plant"}, status=403)
+    try:
+        cards, next_cursor = get_plant_timeline_page(target_plant, request.GET.get('cursor'))
+    except ValueError:
+        return Response({"message": "Broken page cursor"}, status=400)
+    return Response({
+        'cards': LogCardSerializer(cards, many=True).data,
+        'next_cursor': next_cursor,
+    })
+
+
 @api_view(['GET'])
 #@permission_classes((permissions.IsAuthenticated,))
 @permission_classes((permissions.AllowAny,))
 def get_plant_tags_and_rest(request, plant_id: int):
     target_plant = get_object_or_404(Plant, id=plant_id)
+    plant_permissions = get_plant_permissions(request)
+    if not plant_permissions.can_view(target_plant):
+        return Response({"message": "You can't see the plant"}, status=403)
     plant_tags = target_plant.tags.all().values()
     current_user = request.user
     if current_user.is_authenticated: 
-        rich_plant = RichPlant(target_plant)
         # for owner show plant tags and other available tags
-        if check_is_user_owner_of_plant(current_user, rich_plant):
+        if plant_permissions.can_edit(target_plant):
             all_user_tags = Tag.objects.filter(plant__creator=current_user).values()
             # list of dics with all user tags and belonging to current plant
             tags_with_belonging = []
@@ -167,10 +215,10 @@ def get_user_tags(request):
 def set_as_seed(request, plant_id: int):
     current_user = request.user
     target_plant = get_object_or_404(Plant, id=plant_id)
-    rich_plant = RichPlant(target_plant)
-    if check_is_user_owner_of_plant(current_user, rich_plant):
+    if get_plant_permissions(request).can_edit(target_plant):
         target_plant.is_seed = True
         target_plant.save()
+        invalidate_user_summaries(current_user.id)
         return Response({"message": "Plant with id %s was set as seed" % plant_id})
     else: 
         return Response({"message": "You are not the owner of the plant" })
@@ -180,10 +228,10 @@ def set_as_seed(request, plant_id: int):
 def unset_as_seed(request, plant_id: int):
     current_user = request.user
     target_plant = get_object_or_404(Plant, id=plant_id)
-    rich_plant = RichPlant(target_plant)
-    if check_is_user_owner_of_plant(current_user, rich_plant):
+    if get_plant_permissions(request).can_edit(target_plant):
         target_plant.is_seed = False
         target_plant.save()
+        invalidate_user_summaries(current_user.id)
         return Response({"message": "Plant with id %s was set as plant" % plant_id})
     else: 
         return Response({"message": "You are not the owner of the plant" })
@@ -33,24 +33,24 @@ class Label:
         self.dmtx_side_mm = DATA_MATRIX_SIZE // self.ppmm
         self.full_length = LABEL_LENGHT
 
-    def extract_data(self, rich_plant):
-        """Fill current object with data from RichPlant"""
-        self.puid =         rich_plant.uid
-        self.field_number = rich_plant.attrs.number.strip().upper()                 if rich_plant.attrs.number else None
+    def extract_data(self, plant_row):
+        """Fill current object with data from PlantRow"""
+        self.puid =         plant_row.uid
+        self.field_number = plant_row.get('number').strip().upper()                 if plant_row.get('number') else None
         
         # Line 1 data
-        self.genus =        rich_plant.attrs.genus.strip().capitalize()             if rich_plant.attrs.genus else None
-        self.species =      rich_plant.attrs.species.strip().lower()                if rich_plant.attrs.species else None
-        self.subspecies =   rich_plant.attrs.subspecies.strip().lower()             if rich_plant.attrs.subspecies else None
+        self.genus =        plant_row.get('genus').strip().capitalize()             if plant_row.get('genus') else None
+        self.species =      plant_row.get('species').strip().lower()                if plant_row.get('species') else None
+        self.subspecies =   plant_row.get('subspecies').strip().lower()             if plant_row.get('subspecies') else None
         
         # Line 2 data
-        self.variety =      rich_plant.attrs.variety.strip().lower()                if rich_plant.attrs.variety else None
-        self.cultivar =     rich_plant.attrs.cultivar.strip().title()               if rich_plant.attrs.cultivar else None
+        self.variety =      plant_row.get('variety').strip().lower()                if plant_row.get('variety') else None
+        self.cultivar =     plant_row.get('cultivar').strip().title()               if plant_row.get('cultivar') else None
 
         # Line 3 data
-        self.affinity =     rich_plant.attrs.affinity.strip().title()               if rich_plant.attrs.affinity else None
-        self.ex =           rich_plant.attrs.ex.strip().title()                     if rich_plant.attrs.ex else None
-        self.source =       rich_plant.attrs.source.strip()                         if rich_plant.attrs.source else None
+        self.affinity =     plant_row.get('affinity').strip().title()               if plant_row.get('affinity') else None
+        self.ex =           plant_row.get('ex').strip().title()                     if plant_row.get('ex') else None
+        self.source =       plant_row.get('source').strip()                         if plant_row.get('source') else None
 
         self._generate_text_lines()
         self._generate_datamatrix()
@@ -111,8 +111,8 @@ class Label:
 
 
 class LabelsBuilder:
-    def __init__(self, rich_plants:list, user):
-        self.rich_plants = rich_plants
+    def __init__(self, plant_rows:list, user):
+        self.plant_rows = plant_rows
         self.user = user
         self.page_high = 297                                    # high of A4 
         self.v_space = VERTICAL_SPACE                           # vertical space between labels
@@ -218,9 +218,9 @@ class LabelsBuilder:
 
     def generate_labels(self):
         """Generate list of Labels objects"""
-        for rp in self.rich_plants:
+        for row in self.plant_rows:
             label = Label()
-            label.extract_data(rp)
+            label.extract_data(row)
             self._get_label_position(label)
 
             self._place_dmtx(label)
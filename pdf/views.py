@@ -2,8 +2,8 @@ from django.shortcuts import render
 from django.http import HttpResponse, Http404, HttpResponseForbidden
 from django.contrib.auth.decorators import login_required
 from plants.models import Plant
-from plants.entities import RichPlant
-from plants.services import check_is_user_owner_of_plant
+from plants.entities import PlantRow
+from plants.services import get_not_owned_plant_ids
 from .services import LabelsBuilder
 
 
@@ -14,22 +14,20 @@ def get_labels_pdf(request):
     # processing user data
     if request.method == 'POST':
         if request.POST['plant_ids']:
-            # get rich plants
-            plant_ids = request.POST.getlist('plant_ids')
+            try:
+                plant_ids = [int(plant_id) for plant_id in request.POST.getlist('plant_ids')]
+            except ValueError:
+                raise Http404("Wrong plant id")
             plants = Plant.objects.filter(id__in=plant_ids)
-            rich_plants = []
-            for plant in plants: 
-                rich_plants.append(RichPlant(plant))
 
-            # check access (is owner) for all plants
+            # check access (is owner) for all plants at once
             current_user = request.user
-            for rich_plant in rich_plants: 
-                user_is_owner = check_is_user_owner_of_plant(current_user, rich_plant)
-                if not user_is_owner:
-                    return HttpResponseForbidden()
+            not_owned_ids = get_not_owned_plant_ids(current_user, plant_ids)
+            if not_owned_ids:
+                return HttpResponseForbidden(f"You are not the owner of plants: {', '.join(map(str, not_owned_ids))}")
             
             # generate and return pdf 
-            labels  = LabelsBuilder(rich_plants, current_user)
+            labels  = LabelsBuilder(PlantRow.bulk(plants), current_user)
             labels.generate_labels()
             path_to_pdf = labels.get_pdf()
             if path_to_pdf:
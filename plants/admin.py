@@ -1,10 +1,11 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Plant, Attribute, Action, Log, Photo
+from .models import Plant, Attribute, Action, Log, Photo, PlantState
 
 admin.site.register(Plant)
 admin.site.register(Attribute)
 admin.site.register(Action)
 admin.site.register(Log)
 admin.site.register(Photo)
+admin.site.register(PlantState)
@@ -1,6 +1,9 @@
 from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
-from .models import Log, Attribute, Photo
+from .models import Plant, Log, Photo, PlantState
+from .projections import get_attrs_as_list_w_types, rebuild_plant_state
+from .schema import AttributeSchema, get_attribute_schema
 from users.models import User
 
 
@@ -24,19 +27,49 @@ class TagForGroups:
 
 
 class RichPlant:
+    """
+    Plant with its attributes, owner and timeline.
+    Every facet is computed on first access and memoized,
+    so e.g. owner check doesn't prepare timeline cards.
+    """
     def __init__(self, plant_object):
         self.Plant = plant_object
-        self.owner = None
         self.__include_plant_attrs()
-        self.logs = self.__get_logs()
-        self.logs_for_cards = self.__prepare_logs_for_cards()
-        self.attrs_as_dic = self.__get_atts_as_dic()
-        self.attrs_as_list_w_types = self.__get_attrs_as_list_w_types()
-        self.attrs = ExtraAttrs()
-        self.__include_extra_attrs()
-        self.fancy_name = self.__get_fancy_name()
         self.photos = None
-    
+
+    @cached_property
+    def schema(self) -> AttributeSchema:
+        return get_attribute_schema()
+
+    @cached_property
+    def logs(self):
+        return self.__get_logs()
+
+    @cached_property
+    def state(self) -> PlantState:
+        return self.__get_state()
+
+    @cached_property
+    def owner(self):
+        """Owner id"""
+        return self.state.owner_id
+
+    @cached_property
+    def attrs_as_dic(self) -> dict:
+        return self.__get_atts_as_dic()
+
+    @cached_property
+    def attrs_as_list_w_types(self) -> list:
+        return get_attrs_as_list_w_types(self.attrs_as_dic, self.schema)
+
+    @cached_property
+    def attrs(self) -> ExtraAttrs:
+        return self.__get_extra_attrs()
+
+    @cached_property
+    def fancy_name(self) -> str:
+        return self.state.fancy_name
+
     def get_attrs_as_str(self, *args):
         """Return string of requested attrs"""
         result = ''
@@ -49,33 +82,15 @@ class RichPlant:
         """Returns username of Rich plant"""
         return User.objects.get(id=self.owner).username
 
-    def __get_fancy_name(self):
-        fancy_name = ''
-        attrs = self.attrs_as_list_w_types
-        for attr in attrs:
-            if attr['value']:
-                # Field Number always uppercase
-                if attr['key'] == "number":
-                    fancy_name += f"{attr['value'].upper()}: "
-                # Genus always capitlized and italic
-                elif attr['key'] == "genus":
-                    fancy_name += f"<i>{attr['value'].capitalize()}</i> "
-                # species  
-                elif attr['key'] == 'species':
-                    fancy_name += f"<i>{attr['value'].lower()}</i> " 
-                # subspecies, variety always italic and lowercase with short name
-                elif attr['key'] in ['subspecies', 'variety']:
-                    fancy_name += f"{attr['short_name']} <i>{attr['value'].lower()}</i> " 
-                # Cultivated variety alway regular Uppercase
-                elif attr['key'] == 'cultivar':
-                    fancy_name += f"{attr['short_name']}  ‘{attr['value'].title()}’ " 
-                # etc.
-                elif attr['key'] in ['affinity', 'ex']:
-                    fancy_name += f"{attr['short_name']} {attr['value'].title()} " 
-        return fancy_name
+    def __getattr__(self, name):
+        """Plant relations (creator, profile_photo) are loaded only when requested"""
+        plant = self.__dict__.get('Plant')
+        if plant is not None and name in self.__get_model_fields(plant, relations=True):
+            return getattr(plant, name)
+        raise AttributeError(name)
 
     def __include_plant_attrs(self):
-        """Copy Plant model fields"""
+        """Copy Plant model fields (except relations)"""
         plant_fields_names = self.__get_model_fields(self.Plant)
         for field_name in plant_fields_names:
             value = getattr(self.Plant, field_name)
@@ -85,85 +100,35 @@ class RichPlant:
         """Get logs of this plant"""
         return Log.objects.filter(plant=self.Plant.id).order_by(order_by)
 
-    def __prepare_logs_for_cards(self):
-        prepared_logs = []
-
-        for log in self.logs: 
-            l = LogForCard()
-
-            l.action_time = log.action_time
-
-            if log.action_type == 1:
-                l.title = _('Addition')
-            elif log.action_type == 2:
-                l.title = _('Editing')
-            elif log.action_type == 3: 
-                l.title = _('Deleting')
-
-            for key in log.data:
-                if key == 'action':
-                    l.subtitle = log.data[key]
-                elif key == 'photo_url':
-                    l.img_url = log.data[key]
-                elif key == 'comment' or key == 'photo_description':
-                    l.text = log.data[key]
-                else:
-                    if key not in ['photo_id', ]:
-                        l.attrs[key] = log.data[key]
-
-            prepared_logs.append(l)
-
-        return prepared_logs
-
+    def __get_state(self) -> PlantState:
+        """Get projected state of this plant, build it if missing"""
+        try:
+            return self.Plant.state
+        except PlantState.DoesNotExist:
+            return rebuild_plant_state(self.Plant, self.schema, self.logs)
 
     def __get_atts_as_dic(self):
-        """Get extra attributes and values from logs as dic"""
-        # get ordered list of attibute keys
-        all_attrs_keys = list(Attribute.keys.get_all_keys().order_by('weight'))
-        
-        # blank dic init
+        """Get extra attributes and values from plant state as dic"""
         extra_attrs = {}
-        for key in all_attrs_keys:
-            extra_attrs[key] = ''
-
-        # fill with values
-        for log in self.__get_logs(order_by='action_time'): 
-            for key in log.data:
-                if key in extra_attrs:
-                    extra_attrs[key] = log.data[key]
-
-                # detect owner
-                if key == 'owner':
-                    self.owner = log.data[key]
+        for key in self.schema.keys:
+            extra_attrs[key] = self.state.attrs.get(key, '')
 
         return extra_attrs
 
-    def __get_attrs_as_list_w_types(self) -> list:
-        """Get extra attributes as list of dics with: key, value, type"""
-        attrs_as_dic = self.attrs_as_dic
-        attrs_as_list_w_types = []
-        for attr_key in attrs_as_dic:
-            attr =  Attribute.objects.get(key=attr_key)
-            d = {
-                    'key': attr_key, 
-                    'value': self.attrs_as_dic[attr_key],
-                    'type': attr.value_type,
-                    'name': attr.name,
-                    'short_name': attr.short_name
-                }
-            attrs_as_list_w_types.append(d)
-        return attrs_as_list_w_types
-
-    def __include_extra_attrs(self):
-        """Add extra attributes to ReachPlant from dict"""
+    def __get_extra_attrs(self) -> ExtraAttrs:
+        """Extra attributes as object fields from dict"""
+        attrs = ExtraAttrs()
         for key in self.attrs_as_dic:
-            setattr(self.attrs, key, self.attrs_as_dic[key])
+            setattr(attrs, key, self.attrs_as_dic[key])
+        return attrs
 
     @staticmethod
-    def __get_model_fields(obj):
-        """Get model attributs names from object"""
+    def __get_model_fields(obj, relations=False):
+        """Get model attributs names from object (only relations or only not relations)"""
         fields_names = []
         for line in obj._meta.fields:
+            if line.is_relation != relations:
+                continue
             attr_name = str(line).split('.')[-1]
             fields_names.append(attr_name)
         return fields_names
@@ -172,6 +137,58 @@ class RichPlant:
         return Photo.objects.filter(plant=self.Plant)
 
 
+class PlantRow:
+    """
+    Compact plant data for lists and exports: id, uid, fancy name and
+    attribute values in order of keys (keys tuple is shared by all rows)
+    """
+    __slots__ = ('id', 'uid', 'fancy_name', 'values', 'keys')
+
+    def __init__(self, id, uid, fancy_name, values, keys):
+        self.id = id
+        self.uid = uid
+        self.fancy_name = fancy_name
+        self.values = values
+        self.keys = keys
+
+    @classmethod
+    def bulk(cls, plants, schema=None) -> list:
+        """PlantRow-objects from Plant queryset, model objects are not created"""
+        values = plants.values_list('id', 'uid', 'state__fancy_name', 'state__attrs')
+        return list(cls._from_values(values, schema))
+
+    @classmethod
+    def iterate(cls, plants, schema=None, chunk_size=2000):
+        """PlantRow-objects from Plant queryset read chunk by chunk with server-side cursor"""
+        values = plants.values_list('id', 'uid', 'state__fancy_name', 'state__attrs')
+        return cls._from_values(values.iterator(chunk_size=chunk_size), schema)
+
+    @classmethod
+    def _from_values(cls, values, schema=None):
+        schema = schema or get_attribute_schema()
+        keys = tuple(schema.keys)
+        for plant_id, uid, fancy_name, attrs in values:
+            if attrs is None:
+                state = rebuild_plant_state(Plant(id=plant_id), schema)
+                fancy_name, attrs = state.fancy_name, state.attrs
+            yield cls(plant_id, uid, fancy_name, tuple(attrs.get(key, '') for key in keys), keys)
+
+    def get(self, key, default=''):
+        """Value of attribute by key"""
+        try:
+            return self.values[self.keys.index(key)]
+        except ValueError:
+            return default
+
+    def items(self):
+        """Pairs of attribute key and value"""
+        return zip(self.keys, self.values)
+
+    @property
+    def attrs_as_dic(self) -> dict:
+        return dict(self.items())
+
+
 class BrCr:
     '''Breadcrumbs data generator class'''
     def __init__(self):
@@ -197,9 +214,39 @@ class BrCr:
 
 class LogForCard:
     def __init__(self):
+        self.id = None
+        self.action_time = None
         self.title = None
         self.subtitle = None
         self.img_url = None
         self.img_alt = None
         self.text = None
         self.attrs = {}
+
+    @classmethod
+    def from_log(cls, log: Log):
+        """Card of timeline from visible log"""
+        l = cls()
+
+        l.id = log.id
+        l.action_time = log.action_time
+
+        if log.action_type == 1:
+            l.title = _('Addition')
+        elif log.action_type == 2:
+            l.title = _('Editing')
+        elif log.action_type == 3: 
+            l.title = _('Deleting')
+
+        for key in log.data:
+            if key == 'action':
+                l.subtitle = log.data[key]
+            elif key == 'photo_url':
+                l.img_url = log.data[key]
+            elif key == 'comment' or key == 'photo_description':
+                l.text = log.data[key]
+            else:
+                if key not in ['photo_id', ]:
+                    l.attrs[key] = log.data[key]
+
+        return l
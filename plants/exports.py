@@ -0,0 +1,95 @@
+"""
+Export of plant collections.
+
+Rows are read with server-side cursor (chunk by chunk) and written
+as text lines one by one, so memory use doesn't depend on the
+number of plants. CSV is compatible with `import_plants` command
+(logs column is skipped by it).
+"""
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Log, Plant
+from .projections import rebuild_plant_state
+from .schema import get_attribute_schema
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CSV_DELIMITER = ';'
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object returning written line instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def iterate_plant_records(plants, with_logs=False, schema=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Dicts with uid, is_seed, attrs (and logs) of plants from queryset.
+    Logs of every chunk of plants are read with one query.
+    """
+    schema = schema or get_attribute_schema()
+    values = plants.order_by('id').values_list('id', 'uid', 'is_seed', 'state__attrs')
+
+    chunk = []
+    for plant_id, uid, is_seed, attrs in values.iterator(chunk_size=chunk_size):
+        if attrs is None:
+            attrs = rebuild_plant_state(Plant(id=plant_id), schema).attrs
+        chunk.append((plant_id, {
+            'uid': uid,
+            'is_seed': is_seed,
+            'attrs': {key: attrs.get(key, '') for key in schema.keys},
+        }))
+        if len(chunk) == chunk_size:
+            yield from get_records_of_chunk(chunk, with_logs)
+            chunk = []
+    yield from get_records_of_chunk(chunk, with_logs)
+
+
+def get_records_of_chunk(chunk: list, with_logs: bool) -> list:
+    """Records of plants (pairs of id and record) with their visible logs added if necessary"""
+    if with_logs and chunk:
+        for _, record in chunk:
+            record['logs'] = []
+        records = dict(chunk)
+        logs = Log.objects.filter(plant__in=records.keys(), hidden=False) \
+            .order_by('plant', 'action_time', 'id') \
+            .values_list('plant', 'action_time', 'action_type', 'user__username', 'data')
+        for plant_id, action_time, action_type, username, data in logs:
+            records[plant_id]['logs'].append({
+                'action_time': action_time.isoformat(),
+                'action': Log.CHOICES[action_type],
+                'user': username,
+                'data': data,
+            })
+    return [record for _, record in chunk]
+
+
+def export_plants(plants, export_format: str, with_logs=False):
+    """Lines of exported plants from queryset in csv or jsonl format"""
+    schema = get_attribute_schema()
+    records = iterate_plant_records(plants, with_logs, schema)
+
+    if export_format == 'jsonl':
+        for record in records:
+            yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.writer(Echo(), delimiter=CSV_DELIMITER)
+    header = ['uid', 'is_seed'] + list(schema.keys)
+    if with_logs:
+        header.append('logs')
+    yield writer.writerow(header)
+
+    for record in records:
+        row = [record['uid'], int(record['is_seed'])] + list(record['attrs'].values())
+        if with_logs:
+            row.append(json.dumps(record['logs'], cls=DjangoJSONEncoder, ensure_ascii=False))
+        yield writer.writerow(row)
@@ -0,0 +1,64 @@
+import re
+from django.db.models import F, FloatField, Func, TextField
+from django.db.models.functions import Cast
+from django.db.models.fields.json import KeyTextTransform
+
+
+class JSONKeyText(Func):
+    """
+    Text value of the top level key of JSON field.
+
+    Unlike `data__key` lookups the key is written into SQL as a literal,
+    so the same expression in an index and in a query match each other
+    and expression indexes are used (SQLite JSON1 and PostgreSQL).
+    """
+    output_field = TextField()
+
+    def __init__(self, field, key, **extra):
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', key):
+            raise ValueError(f'Unsupported JSON key: {key}')
+        self.key = key
+        super().__init__(F(field) if isinstance(field, str) else field, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        template = "CAST(JSON_EXTRACT(%%(expressions)s, '$.\"%s\"') AS TEXT)" % self.key
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = "(%%(expressions)s ->> '%s')" % self.key
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return compiler.compile(KeyTextTransform(self.key, *self.get_source_expressions()))
+
+    as_oracle = as_mysql
+
+
+class JSONKeyNumber(Func):
+    """
+    Number at the start of the value of the top level key of JSON field,
+    NULL if the value doesn't start with a number.
+
+    Values of number attributes are stored both as JSON numbers and as
+    strings typed in forms, so they are parsed from text.
+    """
+    output_field = FloatField()
+
+    def __init__(self, field, key, **extra):
+        super().__init__(JSONKeyText(field, key), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        template = (
+            "CASE WHEN LTRIM(%(expressions)s) GLOB '[0-9]*' OR LTRIM(%(expressions)s) GLOB '-[0-9]*' "
+            "OR LTRIM(%(expressions)s) GLOB '.[0-9]*' THEN CAST(LTRIM(%(expressions)s) AS REAL) END"
+        )
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = r"CAST(SUBSTRING(%(expressions)s FROM '^\s*(-?([0-9]+([.][0-9]*)?|[.][0-9]+))') AS DOUBLE PRECISION)"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return compiler.compile(Cast(*self.get_source_expressions(), FloatField()))
+
+    as_oracle = as_mysql
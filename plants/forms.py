@@ -3,6 +3,7 @@ from django import forms
 from django.forms import ModelForm
 from django.utils.translation import gettext as _
 from .models import Attribute, Plant, Action, Photo
+from .schema import get_attribute_schema
 
 
 class PlantForm(forms.Form):
@@ -11,7 +12,7 @@ class PlantForm(forms.Form):
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        for attribute in Attribute.objects.all().order_by('weight'):
+        for attribute in get_attribute_schema().attributes:
             # String
             if attribute.value_type == Attribute.AttributeTypeChoices.STRING:
                 self.fields[attribute.key] = forms.CharField(label=attribute.name, max_length=attribute.max_text_length, required=False)
@@ -54,7 +55,7 @@ class ActionForm(forms.Form):
         self.fields['comment'] = forms.CharField(label=_('Comment'), required=False, widget=forms.Textarea)
 
         # related attributes optional fields
-        related_attrs = action.related_attributes.all()
+        related_attrs = get_attribute_schema().related_attrs.get(action.key, [])
         for attr in related_attrs:
             # String
             if attr.value_type == Attribute.AttributeTypeChoices.STRING:
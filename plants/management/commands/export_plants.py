@@ -0,0 +1,43 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from plants.exports import EXPORT_FORMATS, export_plants
+from plants.models import Plant
+from plants.services import get_user_plants
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Export plants of the user (or all plants) to csv or jsonl file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Id of the owner of plants (all plants by default)')
+        parser.add_argument('--format', choices=EXPORT_FORMATS.keys(), default='csv', help='File format')
+        parser.add_argument('--logs', action='store_true', help='Add visible logs of every plant')
+        parser.add_argument('--output', help='Path to result file (stdout by default)')
+
+    def handle(self, *args, **options):
+        if options['user'] is None:
+            plants = Plant.objects.all()
+        elif User.objects.filter(id=options['user']).exists():
+            plants = get_user_plants(options['user'])
+        else:
+            raise CommandError(f'User {options["user"]} does not exist')
+
+        started = time.monotonic()
+        lines = export_plants(plants, options['format'], options['logs'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                count = self.write_lines(f, lines)
+        else:
+            count = self.write_lines(sys.stdout, lines)
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(f'{count} lines were exported ({elapsed:.1f} sec)'))
+
+    def write_lines(self, f, lines) -> int:
+        count = 0
+        for line in lines:
+            f.write(line)
+            count += 1
+        return count
@@ -0,0 +1,66 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+from plants.models import Plant
+from plants.services import create_logs
+from plants.spool import get_spool_path, spool_lock, take_spool, get_flushed_count, set_flushed_count, release_spool
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Write care events waiting in the spool (PLANT_LOG_SPOOL) to the database in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of logs written in one transaction')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and flush the spool every this number of seconds')
+
+    def handle(self, *args, **options):
+        if not get_spool_path():
+            raise CommandError('PLANT_LOG_SPOOL is not set')
+
+        try:
+            with spool_lock(blocking=False, suffix='.flush.lock'):
+                while True:
+                    started = time.monotonic()
+                    flushed, dropped = self.flush(options['batch_size'])
+                    if flushed or not options['interval']:
+                        elapsed = time.monotonic() - started
+                        self.stdout.write(self.style.SUCCESS(
+                            f'{flushed} logs were flushed, {dropped} logs of deleted plants dropped ({elapsed:.1f} sec)'
+                        ))
+                    if not options['interval']:
+                        break
+                    time.sleep(options['interval'])
+                    close_old_connections()
+        except BlockingIOError:
+            raise CommandError('The spool is flushed by another process')
+
+    def flush(self, batch_size) -> tuple:
+        """Returns numbers of written and dropped logs"""
+        logs = take_spool()
+        if not logs:
+            return 0, 0
+
+        start = get_flushed_count()
+        pending = logs[start:]
+
+        # events of deleted plants (and users) can't be written
+        plants = Plant.objects.in_bulk({log.plant_id for log in pending})
+        users = User.objects.in_bulk({log.user_id for log in pending})
+
+        written = 0
+        for batch_start in range(start, len(logs), batch_size):
+            batch = logs[batch_start:batch_start + batch_size]
+            valid_logs = [log for log in batch if log.plant_id in plants and log.user_id in users]
+            for log in valid_logs:
+                log.plant = plants[log.plant_id]
+            # position is saved with the batch, so no batch is written twice
+            with transaction.atomic():
+                create_logs(valid_logs)
+                set_flushed_count(batch_start + len(batch))
+            written += len(valid_logs)
+
+        release_spool()
+        return written, len(pending) - written
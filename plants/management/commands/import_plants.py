@@ -0,0 +1,136 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from plants.models import Log, Plant
+from plants.schema import get_attribute_schema
+from plants.services import create_logs, get_new_upids, prepare_log, UPID_SAVE_ATTEMPTS
+from users.models import User
+
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('', '0', 'false', 'no', 'n')
+
+# exported plants get new UPIDs on import, new plants start their own timelines
+SKIPPED_COLUMNS = ('uid', 'logs')
+
+# exported logs of a plant are written in one column
+CSV_FIELD_SIZE_LIMIT = 2 ** 31 - 1
+
+
+def parse_row(header: list, row: list) -> tuple:
+    """Attributes of the plant from csv row (empty values skipped) and is_seed flag"""
+    data = {}
+    is_seed = ''
+    for key, value in zip(header, row):
+        if not key or key in SKIPPED_COLUMNS:
+            continue
+        # same normalization as in prepare_log()
+        value = value.strip().replace('  ', ' ')
+        if key == 'is_seed':
+            is_seed = value.lower()
+        elif value:
+            data[key] = value
+
+    if is_seed not in TRUE_VALUES + FALSE_VALUES:
+        raise ValueError(f'wrong is_seed value "{is_seed}"')
+    return data, is_seed in TRUE_VALUES
+
+
+def create_plants(user: User, rows: list) -> int:
+    """
+    Plants with addition logs from parsed rows, plants and logs are written with one query each
+    (states and search documents too, see create_logs())
+    """
+    with transaction.atomic():
+        for attempt in range(UPID_SAVE_ATTEMPTS):
+            upids = get_new_upids(len(rows))
+            plants = [
+                Plant(uid=upid, creator=user, is_seed=is_seed)
+                for upid, (data, is_seed) in zip(upids, rows)
+            ]
+            try:
+                with transaction.atomic():
+                    Plant.objects.bulk_create(plants)
+                break
+            except IntegrityError:
+                # some UPIDs were taken by concurrent creation
+                if attempt == UPID_SAVE_ATTEMPTS - 1:
+                    raise
+
+        # not every database returns ids of bulk inserted rows, UPIDs are unique
+        plant_ids = dict(Plant.objects.filter(uid__in=upids).values_list('uid', 'id'))
+
+        now = timezone.now()
+        logs = []
+        for plant, (data, is_seed) in zip(plants, rows):
+            plant.id = plant_ids[plant.uid]
+            logs.append(prepare_log(Log.ActionChoices.ADDITION, user, plant, {**data, 'owner': user.id}, now))
+        create_logs(logs)
+
+    return len(plants)
+
+
+class Command(BaseCommand):
+    help = 'Create plants of the user from csv file: header has attribute keys and optional is_seed column'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to csv file')
+        parser.add_argument('--user', type=int, required=True, help='Id of the owner of new plants')
+        parser.add_argument('--delimiter', default=';', help='Delimiter of csv columns')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of plants written in one transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only validate the file, nothing is written')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(id=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+
+        schema = get_attribute_schema()
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        imported = 0
+        csv.field_size_limit(CSV_FIELD_SIZE_LIMIT)
+        with open(options['csv_file'], newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f, delimiter=options['delimiter'])
+            header = [key.strip() for key in next(reader, [])]
+
+            unknown = [key for key in header if key and key not in ('is_seed',) + SKIPPED_COLUMNS and key not in schema.by_key]
+            if unknown:
+                raise CommandError(f'Unknown columns: {", ".join(unknown)}')
+            if not any(header):
+                raise CommandError('No columns in the header')
+
+            batch = []
+            for row in reader:
+                try:
+                    batch.append(parse_row(header, row))
+                except ValueError as e:
+                    written = '' if dry_run else f', {imported} plants were imported before'
+                    raise CommandError(f'Line {reader.line_num}: {e}{written}')
+
+                if len(batch) == batch_size:
+                    imported += len(batch) if dry_run else create_plants(user, batch)
+                    batch = []
+                    self.report(imported, started)
+
+            if batch:
+                imported += len(batch) if dry_run else create_plants(user, batch)
+                self.report(imported, started)
+
+        elapsed = time.monotonic() - started
+        if dry_run:
+            result = f'{imported} plants are valid, nothing was written'
+        else:
+            result = f'{imported} plants were imported'
+        self.stdout.write(self.style.SUCCESS(f'{result} ({elapsed:.1f} sec)'))
+
+    def report(self, imported, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{imported} rows, {imported / max(elapsed, 1e-6):.0f} rows/s')
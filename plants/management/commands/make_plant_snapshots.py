@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from plants.models import PlantState
+from plants.projections import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Save current state of plants as snapshot logs to shorten replay of their history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plant_ids', nargs='*', type=int, help='Plant ids (all plants by default)')
+        parser.add_argument('--min-logs', type=int, default=1,
+                            help='Only plants with at least this number of logs after the latest snapshot')
+
+    def handle(self, *args, **options):
+        states = PlantState.objects.filter(logs_since_snapshot__gte=options['min_logs']).select_related('plant')
+        if options['plant_ids']:
+            states = states.filter(plant__in=options['plant_ids'])
+
+        count = 0
+        for state in states.iterator():
+            user_id = state.owner_id or state.plant.creator_id
+            if not user_id:
+                self.stderr.write(f'Plant {state.plant_id} has no owner, skipped')
+                continue
+            with transaction.atomic():
+                write_snapshot(state, user_id)
+                state.save(update_fields=['logs_since_snapshot'])
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{count} snapshots were written'))
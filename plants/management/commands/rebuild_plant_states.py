@@ -0,0 +1,203 @@
+import bisect
+import multiprocessing
+import os
+import time
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import F
+from plants.models import Plant, Log, PlantState, PlantSearchDocument
+from plants.projections import build_plant_state, STATE_UPDATE_FIELDS
+from plants.schema import get_attribute_schema
+from plants.search import get_attrs_text, get_notes_text
+
+
+# compared in verify mode
+STATE_FIELDS = ('owner_id', 'attrs', 'fancy_name', 'last_changed', 'logs_since_snapshot')
+
+
+def init_worker():
+    """Worker process must not share db connections with the parent"""
+    django.setup()
+    connections.close_all()
+
+
+def read_chunk(first_id, last_id) -> tuple:
+    """UPIDs of plants in range [first_id, last_id] by ids, their logs by plant ids and number of logs"""
+    uids = dict(Plant.objects.filter(id__gte=first_id, id__lte=last_id).values_list('id', 'uid'))
+    logs_by_plant = {plant_id: [] for plant_id in uids}
+    logs_count = 0
+    for log in Log.objects.filter(plant__gte=first_id, plant__lte=last_id).iterator(chunk_size=5000):
+        logs_by_plant[log.plant_id].append(log)
+        logs_count += 1
+    return uids, logs_by_plant, logs_count
+
+
+def build_chunk(first_id, last_id, from_snapshot) -> tuple:
+    """States and search documents of plants in range [first_id, last_id] replayed from logs, number of logs"""
+    schema = get_attribute_schema()
+    uids, logs_by_plant, logs_count = read_chunk(first_id, last_id)
+    states = [build_plant_state(plant_id, logs_by_plant[plant_id], schema, from_snapshot) for plant_id in uids]
+    documents = [
+        PlantSearchDocument(
+            plant_id=state.plant_id,
+            attrs=get_attrs_text(uids[state.plant_id], state.attrs),
+            notes=get_notes_text(logs_by_plant[state.plant_id]),
+        )
+        for state in states
+    ]
+    return states, documents, logs_count
+
+
+def find_mismatches(states, documents) -> list:
+    """Plant ids with descriptions of stored states and search documents differing from replayed ones"""
+    plant_ids = [state.plant_id for state in states]
+    stored_states = PlantState.objects.in_bulk(plant_ids)
+    stored_documents = PlantSearchDocument.objects.in_bulk(plant_ids)
+
+    mismatches = []
+    for state, document in zip(states, documents):
+        stored_state = stored_states.get(state.plant_id)
+        if stored_state is None:
+            mismatches.append((state.plant_id, 'no stored state'))
+        else:
+            fields = [f for f in STATE_FIELDS if getattr(state, f) != getattr(stored_state, f)]
+            if fields:
+                mismatches.append((state.plant_id, 'differs in ' + ', '.join(fields)))
+
+        stored_document = stored_documents.get(state.plant_id)
+        if stored_document is None:
+            mismatches.append((state.plant_id, 'no search document'))
+        # texts of backdated logs are appended to notes, their order doesn't matter for search
+        elif (document.attrs != stored_document.attrs
+                or sorted(document.notes.split('\n')) != sorted(stored_document.notes.split('\n'))):
+            mismatches.append((state.plant_id, 'search document differs'))
+    return mismatches
+
+
+def save_rebuilt(model, objects, stored_ids, fields):
+    """Update stored objects in place, create missing ones"""
+    model.objects.bulk_update([obj for obj in objects if obj.plant_id in stored_ids], fields, batch_size=1000)
+    # object created by a live write meanwhile is built from the full history too
+    model.objects.bulk_create(
+        [obj for obj in objects if obj.plant_id not in stored_ids], batch_size=1000, ignore_conflicts=True)
+
+
+def process_chunk(task) -> dict:
+    """Rebuild (or verify) states and search documents of plants with ids in range [first_id, last_id]"""
+    first_id, last_id, verify, from_snapshot = task
+
+    mismatches = []
+    if verify:
+        states, documents, logs_count = build_chunk(first_id, last_id, from_snapshot)
+        mismatches = find_mismatches(states, documents)
+    else:
+        with transaction.atomic():
+            # states are locked before logs are read: new logs wait for them in update_plant_states()
+            # (before search documents are changed too), so nothing written by a live write is
+            # overwritten. Unlike select_for_update() the update also takes the write lock of SQLite,
+            # which can't be upgraded later
+            chunk_states = PlantState.objects.filter(plant__gte=first_id, plant__lte=last_id)
+            chunk_states.update(logs_since_snapshot=F('logs_since_snapshot'))
+            stored_state_ids = set(chunk_states.values_list('plant', flat=True))
+            stored_document_ids = set(PlantSearchDocument.objects
+                .filter(plant__gte=first_id, plant__lte=last_id).values_list('plant', flat=True))
+
+            states, documents, logs_count = build_chunk(first_id, last_id, from_snapshot)
+            save_rebuilt(PlantState, states, stored_state_ids, STATE_UPDATE_FIELDS)
+            save_rebuilt(PlantSearchDocument, documents, stored_document_ids, ['attrs', 'notes'])
+
+    return {
+        'range': (first_id, last_id),
+        'plants': len(states),
+        'logs': logs_count,
+        'mismatches': mismatches,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Rebuild plant states and search documents from the full log history, or verify stored ones against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare stored states and search documents with replayed logs, nothing is written')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of plants processed by a worker at once')
+        parser.add_argument('--checkpoint',
+                            help='File with finished chunks, allows to resume interrupted run')
+        parser.add_argument('--from-snapshots', action='store_true',
+                            help='Replay logs starting from the latest snapshot instead of the full history')
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        checkpoint = options['checkpoint']
+        done_ranges = self.read_checkpoint(checkpoint) if checkpoint else []
+
+        tasks = [
+            (first_id, last_id, verify, options['from_snapshots'])
+            for first_id, last_id in self.get_chunks(options['chunk_size'], done_ranges)
+        ]
+        total_plants = Plant.objects.count()
+        self.stdout.write(f'{len(tasks)} chunks to process, {len(done_ranges)} finished before')
+
+        # connections of the parent can't be used in forked workers
+        connections.close_all()
+
+        started = time.monotonic()
+        plants = logs = 0
+        mismatches = []
+        with multiprocessing.Pool(options['workers'], initializer=init_worker) as pool:
+            for result in pool.imap_unordered(process_chunk, tasks):
+                plants += result['plants']
+                logs += result['logs']
+                mismatches += result['mismatches']
+                if checkpoint:
+                    self.write_checkpoint(checkpoint, result['range'])
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{plants}/{total_plants} plants, {logs} logs, '
+                    f'{plants / elapsed:.0f} plants/s, {logs / elapsed:.0f} logs/s'
+                )
+
+        for plant_id, problem in sorted(mismatches):
+            self.stdout.write(self.style.WARNING(f'Plant {plant_id}: {problem}'))
+
+        elapsed = time.monotonic() - started
+        if verify:
+            result = f'{len({plant_id for plant_id, problem in mismatches})} of {plants} plants differ from logs'
+        else:
+            result = f'{plants} plant states and search documents were rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'{result} ({elapsed:.1f} sec)'))
+
+    @staticmethod
+    def get_chunks(chunk_size, done_ranges):
+        """Ranges of plant ids (first, last) not processed before"""
+        starts = [first for first, last in done_ranges]
+        ids = []
+        for plant_id in Plant.objects.order_by('id').values_list('id', flat=True).iterator():
+            i = bisect.bisect_right(starts, plant_id) - 1
+            if i >= 0 and done_ranges[i][0] <= plant_id <= done_ranges[i][1]:
+                continue
+            ids.append(plant_id)
+            if len(ids) == chunk_size:
+                yield ids[0], ids[-1]
+                ids = []
+        if ids:
+            yield ids[0], ids[-1]
+
+    @staticmethod
+    def read_checkpoint(path) -> list:
+        """Sorted ranges of plant ids from checkpoint file"""
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            ranges = [tuple(int(i) for i in line.split('-')) for line in f if line.strip()]
+        return sorted(ranges)
+
+    @staticmethod
+    def write_checkpoint(path, plant_ids_range):
+        with open(path, 'a') as f:
+            f.write('%s-%s\n' % plant_ids_range)
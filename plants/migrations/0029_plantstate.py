@@ -0,0 +1,49 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import taggit.managers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taggit', '0003_taggeditem_add_unique_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('plants', '0028_plant_profile_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plant',
+            name='is_archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='is_seed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='plant',
+            name='tags',
+            field=taggit.managers.TaggableManager(help_text='A comma-separated list of tags.', through='taggit.TaggedItem', to='taggit.Tag', verbose_name='Tags'),
+        ),
+        migrations.AlterField(
+            model_name='log',
+            name='action_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='action time'),
+        ),
+        migrations.CreateModel(
+            name='PlantState',
+            fields=[
+                ('plant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='plants.plant')),
+                ('attrs', models.JSONField(default=dict)),
+                ('fancy_name', models.TextField(blank=True)),
+                ('last_changed', models.DateTimeField(null=True)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
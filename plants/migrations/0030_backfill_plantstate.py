@@ -0,0 +1,81 @@
+from django.db import migrations
+
+
+def get_fancy_name(attrs_as_list_w_types: list) -> str:
+    """Frozen copy of plants.projections.get_fancy_name at the time of this migration"""
+    fancy_name = ''
+    for attr in attrs_as_list_w_types:
+        if attr['value']:
+            # Field Number always uppercase
+            if attr['key'] == "number":
+                fancy_name += f"{attr['value'].upper()}: "
+            # Genus always capitlized and italic
+            elif attr['key'] == "genus":
+                fancy_name += f"<i>{attr['value'].capitalize()}</i> "
+            # species
+            elif attr['key'] == 'species':
+                fancy_name += f"<i>{attr['value'].lower()}</i> "
+            # subspecies, variety always italic and lowercase with short name
+            elif attr['key'] in ['subspecies', 'variety']:
+                fancy_name += f"{attr['short_name']} <i>{attr['value'].lower()}</i> "
+            # Cultivated variety alway regular Uppercase
+            elif attr['key'] == 'cultivar':
+                fancy_name += f"{attr['short_name']}  ‘{attr['value'].title()}’ "
+            # etc.
+            elif attr['key'] in ['affinity', 'ex']:
+                fancy_name += f"{attr['short_name']} {attr['value'].title()} "
+    return fancy_name
+
+
+def backfill_plant_states(apps, schema_editor):
+    """Replay logs of plants without state: owner, attributes and fancy name"""
+    Plant = apps.get_model('plants', 'Plant')
+    Log = apps.get_model('plants', 'Log')
+    Attribute = apps.get_model('plants', 'Attribute')
+    PlantState = apps.get_model('plants', 'PlantState')
+
+    attributes = list(Attribute.objects.order_by('weight'))
+
+    states = []
+    for plant in Plant.objects.filter(state__isnull=True).iterator():
+        attrs = {attr.key: '' for attr in attributes}
+        owner = None
+        last_changed = None
+        for log in Log.objects.filter(plant=plant).order_by('action_time', 'id'):
+            for key in log.data:
+                if key in attrs:
+                    attrs[key] = log.data[key]
+                if key == 'owner':
+                    owner = log.data[key]
+            last_changed = log.action_time
+
+        attrs_as_list_w_types = [
+            {
+                'key': attr.key,
+                'value': attrs[attr.key],
+                'type': attr.value_type,
+                'name': attr.name,
+                'short_name': attr.short_name,
+            }
+            for attr in attributes
+        ]
+        states.append(PlantState(
+            plant=plant,
+            owner_id=owner,
+            attrs=attrs,
+            fancy_name=get_fancy_name(attrs_as_list_w_types),
+            last_changed=last_changed,
+        ))
+
+    PlantState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0029_plantstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_plant_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+def count_logs_since_snapshot(apps, schema_editor):
+    """Number of logs after the latest snapshot (all logs if there are no snapshots) of every plant"""
+    Log = apps.get_model('plants', 'Log')
+    PlantState = apps.get_model('plants', 'PlantState')
+
+    counts = {}
+    logs = Log.objects.filter(plant__isnull=False).order_by('plant', 'action_time', 'id') \
+        .values_list('plant', 'hidden', 'data')
+    for plant_id, hidden, data in logs.iterator(chunk_size=5000):
+        # snapshot is a hidden log with full state of the plant
+        if hidden and isinstance(data, dict) and 'snapshot' in data:
+            counts[plant_id] = 0
+        else:
+            counts[plant_id] = counts.get(plant_id, 0) + 1
+
+    states = []
+    for state in PlantState.objects.all().iterator(chunk_size=1000):
+        state.logs_since_snapshot = counts.get(state.plant_id, 0)
+        states.append(state)
+        if len(states) == 1000:
+            PlantState.objects.bulk_update(states, ['logs_since_snapshot'])
+            states = []
+    PlantState.objects.bulk_update(states, ['logs_since_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0030_backfill_plantstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plantstate',
+            name='logs_since_snapshot',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_logs_since_snapshot, migrations.RunPython.noop),
+    ]
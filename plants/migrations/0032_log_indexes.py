@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0031_plantstate_logs_since_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['plant', 'action_time'], name='log_plant_time_idx'),
+        ),
+    ]
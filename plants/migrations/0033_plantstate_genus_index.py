@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:36
+
+from django.db import migrations, models
+import django.db.models.functions.text
+import plants.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0032_log_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plantstate',
+            index=models.Index(django.db.models.functions.text.Lower(plants.expressions.JSONKeyText('attrs', 'genus')), name='plantstate_genus_idx'),
+        ),
+    ]
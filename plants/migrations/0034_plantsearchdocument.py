@@ -0,0 +1,117 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:39
+
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+
+# frozen copies of helpers from plants.search at the time of this migration
+
+LOG_TEXT_KEYS = ('comment', 'photo_description')
+
+
+def get_attrs_text(uid, attrs: dict) -> str:
+    """UPID and not empty attribute values"""
+    values = [str(uid)] + [str(value) for value in attrs.values() if value not in ('', None)]
+    return ' '.join(values)
+
+
+def get_log_text(data: dict) -> str:
+    """Comment and photo description of the log"""
+    return ' '.join(str(data[key]) for key in LOG_TEXT_KEYS if data.get(key))
+
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE plants_plantsearchdocument_fts USING fts5(
+        attrs, notes, content='plants_plantsearchdocument', content_rowid='plant_id'
+    )""",
+    """CREATE TRIGGER plants_plantsearchdocument_ai AFTER INSERT ON plants_plantsearchdocument BEGIN
+        INSERT INTO plants_plantsearchdocument_fts(rowid, attrs, notes) VALUES (new.plant_id, new.attrs, new.notes);
+    END""",
+    """CREATE TRIGGER plants_plantsearchdocument_ad AFTER DELETE ON plants_plantsearchdocument BEGIN
+        INSERT INTO plants_plantsearchdocument_fts(plants_plantsearchdocument_fts, rowid, attrs, notes)
+        VALUES ('delete', old.plant_id, old.attrs, old.notes);
+    END""",
+    """CREATE TRIGGER plants_plantsearchdocument_au AFTER UPDATE ON plants_plantsearchdocument BEGIN
+        INSERT INTO plants_plantsearchdocument_fts(plants_plantsearchdocument_fts, rowid, attrs, notes)
+        VALUES ('delete', old.plant_id, old.attrs, old.notes);
+        INSERT INTO plants_plantsearchdocument_fts(rowid, attrs, notes) VALUES (new.plant_id, new.attrs, new.notes);
+    END""",
+]
+
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS plants_plantsearchdocument_ai',
+    'DROP TRIGGER IF EXISTS plants_plantsearchdocument_ad',
+    'DROP TRIGGER IF EXISTS plants_plantsearchdocument_au',
+    'DROP TABLE IF EXISTS plants_plantsearchdocument_fts',
+]
+
+POSTGRESQL_FTS = [
+    """CREATE INDEX plants_plantsearchdocument_fts ON plants_plantsearchdocument USING gin (
+        (setweight(to_tsvector('simple', attrs), 'A') || setweight(to_tsvector('simple', notes), 'B'))
+    )""",
+]
+
+POSTGRESQL_FTS_DROP = [
+    'DROP INDEX IF EXISTS plants_plantsearchdocument_fts',
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    """FTS5 table on SQLite, GIN index on PostgreSQL, nothing on other databases"""
+    statements = {'sqlite': SQLITE_FTS, 'postgresql': POSTGRESQL_FTS}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRESQL_FTS_DROP}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def backfill_search_documents(apps, schema_editor):
+    """Search documents of existing plants from their states and timelines"""
+    Log = apps.get_model('plants', 'Log')
+    PlantState = apps.get_model('plants', 'PlantState')
+    PlantSearchDocument = apps.get_model('plants', 'PlantSearchDocument')
+
+    notes = {}
+    logs = (Log.objects
+        .filter(hidden=False)
+        .filter(Q(data__has_key='comment') | Q(data__has_key='photo_description'))
+        .order_by('plant_id', 'action_time', 'id')
+        .values_list('plant_id', 'data'))
+    for plant_id, data in logs.iterator():
+        text = get_log_text(data)
+        if text:
+            notes.setdefault(plant_id, []).append(text)
+
+    documents = []
+    for state in PlantState.objects.select_related('plant').iterator():
+        documents.append(PlantSearchDocument(
+            plant_id=state.plant_id,
+            attrs=get_attrs_text(state.plant.uid, state.attrs),
+            notes='\n'.join(notes.get(state.plant_id, [])),
+        ))
+    PlantSearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0033_plantstate_genus_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantSearchDocument',
+            fields=[
+                ('plant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='plants.plant')),
+                ('attrs', models.TextField(blank=True)),
+                ('notes', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:52
+
+import random
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def renumber_duplicate_uids(apps, schema_editor):
+    """The first plant keeps its UPID, later ones with the same UPID get new ones"""
+    Plant = apps.get_model('plants', 'Plant')
+    PlantSearchDocument = apps.get_model('plants', 'PlantSearchDocument')
+
+    duplicates = Plant.objects.values('uid').annotate(count=Count('id')).filter(count__gt=1)
+    taken = set(Plant.objects.values_list('uid', flat=True))
+    for uid in duplicates.values_list('uid', flat=True):
+        for plant in Plant.objects.filter(uid=uid).order_by('id')[1:]:
+            new_uid = uid
+            while new_uid in taken:
+                new_uid = ''.join(random.choices('0123456789', k=6))
+            taken.add(new_uid)
+            plant.uid = new_uid
+            plant.save(update_fields=['uid'])
+
+            document = PlantSearchDocument.objects.filter(plant=plant).first()
+            if document is not None:
+                document.attrs = document.attrs.replace(uid, new_uid, 1)
+                document.save(update_fields=['attrs'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0034_plantsearchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicate_uids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='plant',
+            name='uid',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0035_plant_uid_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttributeSchemaVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
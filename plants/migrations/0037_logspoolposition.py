@@ -0,0 +1,21 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plants', '0036_attributeschemaversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogSpoolPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('flushed_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
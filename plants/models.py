@@ -1,6 +1,7 @@
 import uuid
 import time
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
 from django.utils.translation import gettext, gettext_lazy as _
 from django.utils import timezone
@@ -8,6 +9,7 @@ from imagekit.models import ImageSpecField
 from pilkit.processors import Thumbnail
 from cdn.storage_backends import PublicMediaStorage
 from taggit.managers import TaggableManager
+from .expressions import JSONKeyText
 
 
 class Plant(models.Model):
@@ -19,6 +21,7 @@ class Plant(models.Model):
 
     uid = models.CharField(
         max_length=10,
+        unique=True,
     )
     
     creation_date = models.DateTimeField(
@@ -177,6 +180,17 @@ class Action(models.Model):
         return f"{self.name} - {self.key} ({self.color})"
 
 
+class AttributeSchemaVersion(models.Model):
+    """Single row with version of attributes and actions, increased on every change of them"""
+
+    version = models.PositiveIntegerField(
+        default=0,
+    )
+
+    def __str__(self):
+        return f"Attribute schema version {self.version}"
+
+
 class Log(models.Model):
 
     CHOICES = {
@@ -220,6 +234,12 @@ class Log(models.Model):
         default=False,
     )
 
+    class Meta:
+        indexes = [
+            # timeline of a plant
+            models.Index(fields=['plant', 'action_time'], name='log_plant_time_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user} {self.CHOICES[self.action_type]} for plant {self.plant.uid}: {str(self.data)}"
 
@@ -276,3 +296,86 @@ class Photo(models.Model):
         blank=True,
         null=True,
     )
+
+
+class PlantState(models.Model):
+    """Current state of the plant projected from its logs"""
+
+    plant = models.OneToOneField(
+        Plant,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='state',
+    )
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+    )
+
+    attrs = models.JSONField(
+        default=dict,
+    )
+
+    fancy_name = models.TextField(
+        blank=True,
+    )
+
+    last_changed = models.DateTimeField(
+        null=True,
+    )
+
+    logs_since_snapshot = models.IntegerField(
+        default=0,
+    )
+
+    class Meta:
+        indexes = [
+            # genus pages and groups, matched ignoring case
+            models.Index(Lower(JSONKeyText('attrs', 'genus')), name='plantstate_genus_idx'),
+        ]
+
+    def __str__(self):
+        return f"State of {self.plant_id} (owner {self.owner_id})"
+
+
+class PlantSearchDocument(models.Model):
+    """Searchable text of the plant, full-text indexed by the database"""
+
+    plant = models.OneToOneField(
+        Plant,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+    )
+
+    # UPID and current attribute values
+    attrs = models.TextField(
+        blank=True,
+    )
+
+    # comments and photo descriptions from the timeline
+    notes = models.TextField(
+        blank=True,
+    )
+
+    def __str__(self):
+        return f"Search document of {self.plant_id}"
+
+
+class LogSpoolPosition(models.Model):
+    """Number of logs of the spool file already written to the database (see plants/spool.py)"""
+
+    path = models.CharField(
+        max_length=255,
+        unique=True,
+    )
+
+    flushed_count = models.PositiveIntegerField(
+        default=0,
+    )
+
+    def __str__(self):
+        return f"{self.flushed_count} logs of {self.path} flushed"
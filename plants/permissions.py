@@ -0,0 +1,77 @@
+from django.db.models import Q
+from users.models import User
+from .models import Plant
+
+
+class PlantPermissions:
+    """
+    Access rights of one user to plants, resolved once per request.
+    Owners and access types of plants and friendships of the user are memoized,
+    so checks of many plants cost a single query.
+    """
+    def __init__(self, user):
+        self.user = user
+        self._plants = {}       # plant id -> (access type, owner id)
+        self._friend_of_ids = None
+
+    @property
+    def friend_of_ids(self) -> set:
+        """Ids of users who have the user in their friends"""
+        if self._friend_of_ids is None:
+            if self.user.is_authenticated:
+                self._friend_of_ids = set(User.objects.filter(friends=self.user).values_list('id', flat=True))
+            else:
+                self._friend_of_ids = set()
+        return self._friend_of_ids
+
+    def is_friend_of(self, user_id) -> bool:
+        """User is in friends of other user, so the user sees their plants for friends"""
+        return user_id in self.friend_of_ids
+
+    def load(self, plants):
+        """Read access types and owners of plants (objects or ids) not loaded before"""
+        plant_ids = {getattr(plant, 'id', plant) for plant in plants} - self._plants.keys()
+        if plant_ids:
+            for plant_id, access_type, owner_id in Plant.objects.filter(id__in=plant_ids).values_list('id', 'access_type', 'state__owner'):
+                self._plants[plant_id] = (access_type, owner_id)
+
+    def get_owner_id(self, plant):
+        plant_id = getattr(plant, 'id', plant)
+        if plant_id not in self._plants:
+            self.load([plant_id])
+        return self._plants.get(plant_id, (None, None))[1]
+
+    def can_edit(self, plant) -> bool:
+        """Only owner changes the plant"""
+        return self.user.is_authenticated and self.get_owner_id(plant) == self.user.id
+
+    def can_view(self, plant) -> bool:
+        """Public plants are seen by everybody, plants for friends by friends of the owner"""
+        plant_id = getattr(plant, 'id', plant)
+        if plant_id not in self._plants:
+            self.load([plant_id])
+        if plant_id not in self._plants:
+            return False
+        access_type, owner_id = self._plants[plant_id]
+        if access_type == Plant.AccessTypeChoices.PUBLIC:
+            return True
+        if not self.user.is_authenticated:
+            return False
+        if owner_id == self.user.id:
+            return True
+        return access_type == Plant.AccessTypeChoices.FRIENDS and self.is_friend_of(owner_id)
+
+    def visible_plants(self):
+        """Queryset of all plants the user can see"""
+        visible = Q(access_type=Plant.AccessTypeChoices.PUBLIC)
+        if self.user.is_authenticated:
+            visible |= Q(state__owner=self.user)
+            visible |= Q(access_type=Plant.AccessTypeChoices.FRIENDS, state__owner__in=self.friend_of_ids)
+        return Plant.objects.filter(visible)
+
+
+def get_plant_permissions(request) -> PlantPermissions:
+    """Permissions of the request user, created once per request"""
+    if not hasattr(request, 'plant_permissions'):
+        request.plant_permissions = PlantPermissions(request.user)
+    return request.plant_permissions
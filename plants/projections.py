@@ -0,0 +1,233 @@
+"""
+Plant state projection.
+
+Current attribute values and owner of a plant are defined by its logs.
+Instead of replaying all of them on every read, the result is kept in
+PlantState and updated each time a new log is written.
+
+Every PLANT_SNAPSHOT_INTERVAL logs the state is also saved as a hidden
+snapshot log, so rebuilding the state replays only logs after it.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import Log, PlantState
+from .schema import AttributeSchema, get_attribute_schema
+
+
+def get_attrs_as_list_w_types(attrs_as_dic: dict, schema: AttributeSchema = None) -> list:
+    """Get attributes as list of dics with: key, value, type, name, short_name"""
+    schema = schema or get_attribute_schema()
+    attrs_as_list_w_types = []
+    for attr_key in attrs_as_dic:
+        attr = schema.by_key[attr_key]
+        d = {
+                'key': attr_key,
+                'value': attrs_as_dic[attr_key],
+                'type': attr.value_type,
+                'name': attr.name,
+                'short_name': attr.short_name
+            }
+        attrs_as_list_w_types.append(d)
+    return attrs_as_list_w_types
+
+
+def get_fancy_name(attrs_as_list_w_types: list) -> str:
+    """Botanical name of the plant with html formatting"""
+    fancy_name = ''
+    for attr in attrs_as_list_w_types:
+        if attr['value']:
+            # Field Number always uppercase
+            if attr['key'] == "number":
+                fancy_name += f"{attr['value'].upper()}: "
+            # Genus always capitlized and italic
+            elif attr['key'] == "genus":
+                fancy_name += f"<i>{attr['value'].capitalize()}</i> "
+            # species
+            elif attr['key'] == 'species':
+                fancy_name += f"<i>{attr['value'].lower()}</i> "
+            # subspecies, variety always italic and lowercase with short name
+            elif attr['key'] in ['subspecies', 'variety']:
+                fancy_name += f"{attr['short_name']} <i>{attr['value'].lower()}</i> "
+            # Cultivated variety alway regular Uppercase
+            elif attr['key'] == 'cultivar':
+                fancy_name += f"{attr['short_name']}  ‘{attr['value'].title()}’ "
+            # etc.
+            elif attr['key'] in ['affinity', 'ex']:
+                fancy_name += f"{attr['short_name']} {attr['value'].title()} "
+    return fancy_name
+
+
+def apply_log_data(attrs: dict, owner, data: dict):
+    """Apply data of one log to attributes dic, returns owner id"""
+    for key in data:
+        if key in attrs:
+            attrs[key] = data[key]
+
+        # detect owner
+        if key == 'owner':
+            owner = data[key]
+    return owner
+
+
+def is_snapshot(log: Log) -> bool:
+    """Snapshot is a hidden log with full state of the plant"""
+    return log.hidden and 'snapshot' in log.data
+
+
+def get_snapshot_interval() -> int:
+    """Number of logs after which new snapshot is written"""
+    return getattr(settings, 'PLANT_SNAPSHOT_INTERVAL', 50)
+
+
+def get_snapshots(plant_id):
+    return Log.objects.filter(plant=plant_id, hidden=True, data__has_key='snapshot')
+
+
+def write_snapshot(state: PlantState, user_id) -> Log:
+    """Save current state of the plant as hidden log"""
+    data = dict(state.attrs)
+    data['owner'] = state.owner_id
+    data['snapshot'] = True
+
+    snapshot = Log(
+        action_type=Log.ActionChoices.CHANGE,
+        user_id=user_id,
+        plant_id=state.plant_id,
+        data=data,
+        hidden=True,
+        action_time=state.last_changed or timezone.now(),
+    )
+    snapshot.save()
+    state.logs_since_snapshot = 0
+    return snapshot
+
+
+def build_plant_state(plant_id, logs, schema: AttributeSchema = None, from_snapshot=True) -> PlantState:
+    """
+    Replay logs of the plant (in any order) without saving the result.
+    Replay starts from the latest snapshot, or from the very first log
+    (ignoring snapshots) if from_snapshot is False.
+    """
+    schema = schema or get_attribute_schema()
+    logs = sorted(logs, key=lambda log: (log.action_time, log.id))
+
+    snapshot_index = None
+    for i in range(len(logs) - 1, -1, -1):
+        if is_snapshot(logs[i]):
+            snapshot_index = i
+            break
+
+    if snapshot_index is None:
+        logs_since_snapshot = len(logs)
+    else:
+        logs_since_snapshot = len(logs) - snapshot_index - 1
+
+    if from_snapshot and snapshot_index is not None:
+        logs = logs[snapshot_index:]
+    else:
+        logs = [log for log in logs if not is_snapshot(log)]
+
+    attrs = schema.get_blank_attrs()
+    owner = None
+    last_changed = None
+    for log in logs:
+        owner = apply_log_data(attrs, owner, log.data)
+        last_changed = log.action_time
+
+    return PlantState(
+        plant_id=plant_id,
+        owner_id=owner,
+        attrs=attrs,
+        fancy_name=get_fancy_name(get_attrs_as_list_w_types(attrs, schema)),
+        last_changed=last_changed,
+        logs_since_snapshot=logs_since_snapshot,
+    )
+
+
+def rebuild_plant_state(plant, schema: AttributeSchema = None, logs=None) -> PlantState:
+    """
+    Replay logs of the plant starting from the latest snapshot and save the result.
+    Already fetched logs of the plant can be passed in any order.
+    """
+    if logs is None:
+        logs = Log.objects.filter(plant=plant)
+        snapshot = get_snapshots(plant).order_by('-action_time', '-id').first()
+        if snapshot:
+            logs = logs.filter(
+                Q(action_time__gt=snapshot.action_time) |
+                Q(action_time=snapshot.action_time, id__gte=snapshot.id)
+            )
+
+    state = build_plant_state(plant.id, logs, schema)
+    state.plant = plant
+    state.save()
+    return state
+
+
+# written by update_plant_states() for states changed in place
+STATE_UPDATE_FIELDS = ['owner', 'attrs', 'fancy_name', 'last_changed', 'logs_since_snapshot']
+
+
+def update_plant_states(logs: list) -> dict:
+    """
+    Apply new saved logs (of one or many plants) to states of their plants.
+    States are locked and read with one query, each of them is written once.
+    Returns states by plant ids.
+    """
+    schema = get_attribute_schema()
+
+    logs_by_plant = {}
+    for log in sorted(logs, key=lambda log: log.action_time):
+        logs_by_plant.setdefault(log.plant_id, []).append(log)
+
+    states = PlantState.objects.select_for_update().in_bulk(logs_by_plant.keys())
+
+    changed_states = []
+    missing_ids = []
+    for plant_id, plant_logs in logs_by_plant.items():
+        state = states.get(plant_id)
+        if state is None:
+            missing_ids.append(plant_id)
+            continue
+
+        # logs written in the past change the order of replay
+        first_time = plant_logs[0].action_time
+        if state.last_changed and first_time < state.last_changed:
+            # snapshots made after this moment don't include the logs
+            get_snapshots(plant_id).filter(action_time__gt=first_time).delete()
+            states[plant_id] = rebuild_plant_state(plant_logs[0].plant, schema)
+            continue
+
+        # keep attribute order (and attributes created after the last rebuild)
+        attrs = schema.get_blank_attrs()
+        for key in attrs:
+            attrs[key] = state.attrs.get(key, '')
+
+        for log in plant_logs:
+            state.owner_id = apply_log_data(attrs, state.owner_id, log.data)
+        state.attrs = attrs
+        state.fancy_name = get_fancy_name(get_attrs_as_list_w_types(attrs, schema))
+        state.last_changed = plant_logs[-1].action_time
+        state.logs_since_snapshot += len(plant_logs)
+
+        if state.logs_since_snapshot >= get_snapshot_interval():
+            write_snapshot(state, plant_logs[-1].user_id)
+        changed_states.append(state)
+
+    if changed_states:
+        PlantState.objects.bulk_update(changed_states, STATE_UPDATE_FIELDS)
+
+    # new plants, the whole history is replayed
+    if missing_ids:
+        history = {plant_id: [] for plant_id in missing_ids}
+        for log in Log.objects.filter(plant__in=missing_ids):
+            history[log.plant_id].append(log)
+        new_states = [
+            build_plant_state(plant_id, plant_logs, schema, from_snapshot=False)
+            for plant_id, plant_logs in history.items()
+        ]
+        PlantState.objects.bulk_create(new_states)
+        states.update((state.plant_id, state) for state in new_states)
+
+    return states
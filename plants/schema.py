@@ -0,0 +1,71 @@
+import time
+from django.conf import settings
+from django.db.models import F
+from .models import Attribute, Action, AttributeSchemaVersion
+
+
+class AttributeSchema:
+    """Snapshot of attributes and actions metadata, shared by many plants"""
+    def __init__(self, attributes=None, actions=None):
+        if attributes is None:
+            attributes = Attribute.objects.order_by('weight')
+        if actions is None:
+            actions = Action.objects.prefetch_related('related_attributes')
+        self.attributes = list(attributes)
+        self.keys = [attr.key for attr in self.attributes]
+        self.by_key = {attr.key: attr for attr in self.attributes}
+        self.filterable = {attr.key for attr in self.attributes if attr.filterable}
+        self.show_in_list = {attr.key for attr in self.attributes if attr.show_in_list}
+        self.actions = {action.key: action for action in actions}
+        self.related_attrs = {
+            key: [self.by_key[attr.key] for attr in action.related_attributes.all() if attr.key in self.by_key]
+            for key, action in self.actions.items()
+        }
+
+    def get_blank_attrs(self) -> dict:
+        """Dic with all attribute keys in order of weight and empty values"""
+        return {key: '' for key in self.keys}
+
+
+# Schema loaded by this process and its version
+_schema = None
+_schema_version = None
+
+# Latest version read from the database and when it was read
+_latest_version = None
+_latest_version_time = 0
+
+
+def get_schema_version() -> str:
+    """
+    Current version of schema shared by all workers through the database.
+    It is read at most once per PLANT_SCHEMA_CHECK_INTERVAL seconds,
+    so other workers reload the schema within the interval after a change.
+    """
+    global _latest_version, _latest_version_time
+    now = time.monotonic()
+    interval = getattr(settings, 'PLANT_SCHEMA_CHECK_INTERVAL', 1)
+    if _latest_version is None or now - _latest_version_time >= interval:
+        version = AttributeSchemaVersion.objects.filter(id=1).values_list('version', flat=True).first()
+        _latest_version = str(version or 0)
+        _latest_version_time = now
+    return _latest_version
+
+
+def get_attribute_schema() -> AttributeSchema:
+    """Attribute schema loaded once per process until the version is bumped"""
+    global _schema, _schema_version
+    version = get_schema_version()
+    if _schema is None or version != _schema_version:
+        _schema = AttributeSchema()
+        _schema_version = version
+    return _schema
+
+
+def bump_schema_version():
+    """Invalidate loaded schema in all workers"""
+    global _schema, _latest_version
+    _schema = None
+    _latest_version = None
+    AttributeSchemaVersion.objects.get_or_create(id=1)
+    AttributeSchemaVersion.objects.filter(id=1).update(version=F('version') + 1)
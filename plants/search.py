@@ -0,0 +1,132 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from .models import Log, PlantSearchDocument
+
+
+# SQLite FTS5 table over search documents, see migration 0034
+FTS_TABLE = 'plants_plantsearchdocument_fts'
+
+# PostgreSQL GIN index is built on the same expression
+TSVECTOR = "(setweight(to_tsvector('simple', attrs), 'A') || setweight(to_tsvector('simple', notes), 'B'))"
+
+# free text in log data
+LOG_TEXT_KEYS = ('comment', 'photo_description')
+
+MAX_SEARCH_TERMS = 10
+
+_has_fts_table = None
+
+
+def get_attrs_text(uid, attrs: dict) -> str:
+    """UPID and not empty attribute values"""
+    values = [str(uid)] + [str(value) for value in attrs.values() if value not in ('', None)]
+    return ' '.join(values)
+
+
+def get_log_text(data: dict) -> str:
+    """Comment and photo description of the log"""
+    return ' '.join(str(data[key]) for key in LOG_TEXT_KEYS if data.get(key))
+
+
+def get_notes_text(logs) -> str:
+    """Texts of visible logs of the plant in timeline order"""
+    logs = sorted(logs, key=lambda log: (log.action_time, log.id))
+    return '\n'.join(filter(None, [get_log_text(log.data) for log in logs if not log.hidden]))
+
+
+def create_search_documents(plants: list, states: dict) -> list:
+    """Search documents of plants from their states and whole timelines"""
+    notes = {plant.id: [] for plant in plants}
+    logs = Log.objects.filter(plant__in=notes.keys(), hidden=False) \
+        .order_by('plant', 'action_time', 'id').values_list('plant', 'data')
+    for plant_id, data in logs:
+        text = get_log_text(data)
+        if text:
+            notes[plant_id].append(text)
+
+    documents = [
+        PlantSearchDocument(
+            plant=plant,
+            attrs=get_attrs_text(plant.uid, states[plant.id].attrs),
+            notes='\n'.join(notes[plant.id]),
+        )
+        for plant in plants
+    ]
+    return PlantSearchDocument.objects.bulk_create(documents)
+
+
+def update_search_documents(logs: list, states: dict):
+    """Apply new logs to search documents of their plants, documents are read and written once"""
+    logs_by_plant = {}
+    for log in sorted(logs, key=lambda log: log.action_time):
+        logs_by_plant.setdefault(log.plant_id, []).append(log)
+
+    documents = PlantSearchDocument.objects.in_bulk(logs_by_plant.keys())
+    for plant_id, plant_logs in logs_by_plant.items():
+        document = documents.get(plant_id)
+        if document is None:
+            continue
+        document.attrs = get_attrs_text(plant_logs[0].plant.uid, states[plant_id].attrs)
+        texts = [get_log_text(log.data) for log in plant_logs if not log.hidden]
+        document.notes = '\n'.join(filter(None, [document.notes, *texts]))
+
+    if documents:
+        PlantSearchDocument.objects.bulk_update(documents.values(), ['attrs', 'notes'])
+
+    new_plants = [plant_logs[0].plant for plant_id, plant_logs in logs_by_plant.items() if plant_id not in documents]
+    if new_plants:
+        create_search_documents(new_plants, states)
+
+
+def has_fts_table() -> bool:
+    global _has_fts_table
+    if _has_fts_table is None:
+        _has_fts_table = FTS_TABLE in connection.introspection.table_names()
+    return _has_fts_table
+
+
+def get_search_terms(query: str) -> list:
+    """Words of the query, anything else is dropped"""
+    return re.findall(r'\w+', query.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_plants(query: str, plants, limit=100) -> list:
+    """
+    Ids of plants from the queryset having all words of the query
+    (as prefixes) in attributes or timeline, most relevant first.
+    Attribute matches weigh more than comments.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return []
+
+    plants_sql, plants_params = plants.values('id').query.sql_with_params()
+
+    if connection.vendor == 'sqlite' and has_fts_table():
+        sql = (
+            f'SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid IN ({plants_sql}) '
+            f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s'
+        )
+        params = [' '.join('"%s"*' % term for term in terms), *plants_params, limit]
+
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f'SELECT plant_id FROM plants_plantsearchdocument '
+            f"WHERE {TSVECTOR} @@ to_tsquery('simple', %s) AND plant_id IN ({plants_sql}) "
+            f"ORDER BY ts_rank({TSVECTOR}, to_tsquery('simple', %s)) DESC LIMIT %s"
+        )
+        tsquery = ' & '.join('%s:*' % term for term in terms)
+        params = [tsquery, *plants_params, tsquery, limit]
+
+    # no full-text index, substring search
+    else:
+        documents = PlantSearchDocument.objects.filter(plant__in=plants)
+        for term in terms:
+            documents = documents.filter(Q(attrs__icontains=term) | Q(notes__icontains=term))
+        return list(documents.order_by('-plant_id').values_list('plant_id', flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
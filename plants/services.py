@@ -1,5 +1,4 @@
 import random
-import string
 import time
 import datetime
 import copy
@@ -8,91 +7,280 @@ import math
 import numpy as np
 import cv2
 import io
+import json
+import base64
 from PIL import Image
 from pylibdmtx import pylibdmtx
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Value, TextField, FloatField
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext as _
-from plants.models import Log, Plant, Attribute
-from plants.entities import RichPlant
+from plants.models import Log, Plant, PlantState, Attribute
+from plants.expressions import JSONKeyText, JSONKeyNumber
+from plants.entities import PlantRow, GenusForGroups, TagForGroups, LogForCard
+from plants.projections import update_plant_states
+from plants.schema import get_attribute_schema
+from plants.search import search_plants, update_search_documents
+from plants.spool import append_logs, get_pending_logs, is_deferrable
+from plants.summaries import invalidate_user_summaries
 from users.models import User
 from taggit.models import Tag
 
 
 # Plants
 
-def get_user_plants(user_id, access=[], tag_id=None, seeds=None):
-    """Returns Plant-objects of user by user id"""
+def get_user_plants(user_id, access=[], tag_id=None, seeds=None, attrs=None):
+    """
+    Returns Plant-objects of user by user id.
+    `attrs` - current attribute values to match case-insensitively, e.g. {'genus': 'lithops'}
+    """
     if not access: 
         access = [0,1,2]  # wbithot specifying acces type - returns all plants 
-    plant_ids = Log.objects.filter(data__owner=user_id).values_list('plant', flat=True)
+    # owner is kept in indexed column of plant state
+    plants = Plant.objects.filter(state__owner=user_id, access_type__in=access)
     if seeds in [True, False]:
-        if tag_id:
-            tag = Tag.objects.get(id=tag_id)
-            plants = Plant.objects.filter(id__in=plant_ids, tags__in=[tag], access_type__in=access, is_seed=seeds)
-        else:
-            plants = Plant.objects.filter(id__in=plant_ids, access_type__in=access, is_seed=seeds)
-    else:
-        if tag_id:
-            tag = Tag.objects.get(id=tag_id)
-            plants = Plant.objects.filter(id__in=plant_ids, tags__in=[tag], access_type__in=access)
-        else:
-            plants = Plant.objects.filter(id__in=plant_ids, access_type__in=access)
+        plants = plants.filter(is_seed=seeds)
+    if tag_id:
+        tag = Tag.objects.get(id=tag_id)
+        plants = plants.filter(tags__in=[tag])
+    if attrs:
+        plants = filter_plants_by_attrs(plants, attrs)
     return plants
 
-def get_user_richplants(user_id, access=[], genus=None, tag_id=None, seeds=None) -> list:
-    """Returns RichPlant-objects of user by user id"""
-    if seeds in [True, False]:
-        plants = get_user_plants(user_id, access, tag_id, seeds=seeds)
-    else:
-        plants = get_user_plants(user_id, access, tag_id)
-    rich_plants = []
-    for plant in plants:
-        rich_plant = RichPlant(plant)
-        if genus: 
-            genus_in_plant = rich_plant.attrs.genus
-            if genus_in_plant.lower() == genus.lower():
-                rich_plants.append(rich_plant)
-        else:
-            rich_plants.append(rich_plant)
-    return rich_plants
+def filter_plants_by_attrs(plants, attrs: dict):
+    """Filter plants queryset by current attribute values ignoring case"""
+    # inner join lets database start from attribute index of plant states
+    plants = plants.filter(state__isnull=False)
+    for attr_name, value in attrs.items():
+        alias = f'attr_{attr_name}_lower'
+        plants = (plants
+            .alias(**{alias: Lower(JSONKeyText('state__attrs', attr_name))})
+            .filter(**{alias: str(value).lower()}))
+    return plants
+
+def get_plant_groups(plants) -> dict:
+    """
+    Genuses and tags of plants with number of plants, separately for plants and seeds:
+
+    {
+        'genuses': [GenusForGroups, ...],
+        'tags': [TagForGroups, ...],
+        'seeds_genuses': [GenusForGroups, ...],
+        'seeds_tags': [TagForGroups, ...],
+    }
+
+    Counted by two aggregate queries, plant objects are not created
+    """
+    groups = {'genuses': [], 'tags': [], 'seeds_genuses': [], 'seeds_tags': []}
+
+    genuses = (plants
+        .annotate(genus=Lower(JSONKeyText('state__attrs', 'genus')))
+        .exclude(genus__isnull=True)
+        .exclude(genus='')
+        .values('is_seed', 'genus')
+        .annotate(number=Count('id'))
+        .order_by('genus'))
+    for row in genuses:
+        genus_obj = GenusForGroups()
+        genus_obj.name = row['genus']
+        genus_obj.number = row['number']
+        groups['seeds_genuses' if row['is_seed'] else 'genuses'].append(genus_obj)
+
+    tags = (plants
+        .filter(tags__isnull=False)
+        .values('is_seed', 'tags__id', 'tags__name')
+        .annotate(number=Count('id'))
+        .order_by('tags__name'))
+    for row in tags:
+        tag_obj = TagForGroups()
+        tag_obj.name = row['tags__name']
+        tag_obj.id = row['tags__id']
+        tag_obj.number = row['number']
+        groups['seeds_tags' if row['is_seed'] else 'tags'].append(tag_obj)
+
+    return groups
+
+def search_plant_rows(plants, query: str) -> list:
+    """PlantRow-objects of plants from queryset found by full-text search, best first"""
+    plant_ids = search_plants(query, plants)
+    return get_plant_rows_in_order(plant_ids)
+
+def get_plant_rows_in_order(plant_ids: list) -> list:
+    """PlantRow-objects in order of given plant ids"""
+    position = {plant_id: i for i, plant_id in enumerate(plant_ids)}
+    plant_rows = PlantRow.bulk(Plant.objects.filter(id__in=plant_ids))
+    return sorted(plant_rows, key=lambda row: position[row.id])
+
+# Plant fields the list can be sorted by, besides attributes
+PLANT_SORT_FIELDS = ('uid', 'creation_date')
+
+def get_plant_sort_keys() -> list:
+    return list(PLANT_SORT_FIELDS) + get_attribute_schema().keys
+
+# sort value of number attributes without number, goes first as empty text does
+MISSING_NUMBER_SORT_VALUE = -1e300
+
+def get_plant_sort_expression(key):
+    """Value plants are sorted by: plant field or current attribute value"""
+    if key in PLANT_SORT_FIELDS:
+        return F(key)
+    schema = get_attribute_schema()
+    if key in schema.keys:
+        if schema.by_key[key].value_type == Attribute.AttributeTypeChoices.NUMBER:
+            return Coalesce(JSONKeyNumber('state__attrs', key), Value(MISSING_NUMBER_SORT_VALUE), output_field=FloatField())
+        return Coalesce(JSONKeyText('state__attrs', key), Value(''), output_field=TextField())
+    raise ValueError(f'Unknown sort key: {key}')
+
+def encode_page_cursor(sort_value, plant_id) -> str:
+    """Position of the last plant (or log) on a page as url-safe string"""
+    # dates keep microseconds, otherwise plants of the same second repeat on the next page
+    data = json.dumps([sort_value, plant_id], default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+def decode_page_cursor(cursor: str) -> tuple:
+    try:
+        sort_value, plant_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(plant_id)
+    except (ValueError, TypeError):
+        raise ValueError(f'Broken page cursor: {cursor}')
+
+def get_sorted_plants(plants, sort='creation_date'):
+    """
+    Plants queryset ordered by plant field or attribute key,
+    with '-' for descending order. Id breaks ties.
+    """
+    descending = sort.startswith('-')
+    plants = plants.annotate(sort_value=get_plant_sort_expression(sort.lstrip('-')))
+    order = ('-sort_value', '-id') if descending else ('sort_value', 'id')
+    return plants.order_by(*order)
+
+def get_plants_page(plants, sort='creation_date', cursor=None, page_size=None) -> tuple:
+    """
+    Returns page of PlantRow-objects and cursor of the next page (None on the last page).
+
+    `sort` - plant field or attribute key, with '-' for descending order.
+    Keyset pagination: the page starts right after (sort value, id) of the cursor,
+    so cost of any page doesn't depend on its number.
+    """
+    page_size = page_size or getattr(settings, 'PLANT_LIST_PAGE_SIZE', 100)
+    plants = get_sorted_plants(plants, sort)
+
+    if cursor:
+        sort_value, plant_id = decode_page_cursor(cursor)
+        after = 'lt' if sort.startswith('-') else 'gt'
+        plants = plants.filter(
+            Q(**{f'sort_value__{after}': sort_value}) |
+            Q(**{'sort_value': sort_value, f'id__{after}': plant_id})
+        )
+
+    keys = list(plants.values_list('sort_value', 'id')[:page_size + 1])
+
+    next_cursor = encode_page_cursor(*keys[page_size - 1]) if len(keys) > page_size else None
+    plant_rows = get_plant_rows_in_order([plant_id for sort_value, plant_id in keys[:page_size]])
+    return plant_rows, next_cursor
+
+def get_plant_timeline_page(plant: Plant, cursor=None, page_size=None) -> tuple:
+    """
+    Returns page of timeline cards (LogForCard-objects), newest first,
+    and cursor of the next page (None on the last page).
+    Keyset pagination on (action_time, id), see get_plants_page().
+    """
+    page_size = page_size or getattr(settings, 'PLANT_TIMELINE_PAGE_SIZE', 20)
+
+    # snapshots and other service logs are not shown
+    logs = Log.objects.filter(plant=plant, hidden=False).order_by('-action_time', '-id')
+    if cursor:
+        action_time, log_id = decode_page_cursor(cursor)
+        action_time = parse_datetime(str(action_time))
+        if action_time is None:
+            raise ValueError(f'Broken page cursor: {cursor}')
+        logs = logs.filter(Q(action_time__lt=action_time) | Q(action_time=action_time, id__lt=log_id))
+
+    logs = list(logs[:page_size + 1])
+    next_cursor = None
+    if len(logs) > page_size:
+        logs = logs[:page_size]
+        next_cursor = encode_page_cursor(logs[-1].action_time, logs[-1].id)
+
+    # events not flushed from the spool yet are the newest ones
+    if not cursor:
+        logs = get_pending_logs(plant.id)[::-1] + logs
+    return [LogForCard.from_log(log) for log in logs], next_cursor
+
+def get_list_columns() -> list:
+    """Attributes shown in the plant list: key, title and translation"""
+    schema = get_attribute_schema()
+    return [
+        {'key': attr.key, 'name': attr.name, 'transl': _(attr.name)}
+        for attr in schema.attributes if attr.key in schema.show_in_list
+    ]
 
 def create_new_plant(user: User) -> Plant:
     """New Plant creation"""
-    new_upid = get_new_upid()
-    new_plant = Plant(uid=new_upid, creator=user)
-    new_plant.save()
+    for attempt in range(UPID_SAVE_ATTEMPTS):
+        new_plant = Plant(uid=get_new_upid(), creator=user)
+        try:
+            with transaction.atomic():
+                new_plant.save()
+            break
+        except IntegrityError:
+            # the same UPID was taken by concurrent creation
+            if attempt == UPID_SAVE_ATTEMPTS - 1:
+                raise
+    invalidate_user_summaries(user.id)
     return new_plant
 
-def get_new_upid():
+UPID_DIGITS = 6
+UPID_SAVE_ATTEMPTS = 5
+
+def get_new_upid() -> str:
     """Unique Plant ID Generator"""
-    while True: 
-        # Example: '798670'
-        random_string = ''.join(random.choices(string.digits, k=6))
-        
-        # Check uniqueness
-        if Plant.objects.filter(uid=random_string).count() == 0:
-            upid = random_string
-            break
-    return upid
-
-def filter_plants(rich_plants: list, filter_data: dict) -> list:
-    """Filter plants according to filtered data"""
-    plant_pass_grade = {}
-    
-    # pass grade calculation
-    for plant in rich_plants:
-        plant_pass_grade[plant] = 0
-        for attr_name in filter_data:
-            for val in filter_data[attr_name]:
-                if getattr(plant.attrs, attr_name) == val:
-                    plant_pass_grade[plant] += 1
-    
-    # check grade 
-    filter_plants = []
-    for plant in plant_pass_grade:
-        if plant_pass_grade[plant] == len(filter_data):
-            filter_plants.append(plant)
-
-    return filter_plants
+    return get_new_upids(1)[0]
+
+def get_new_upids(count: int) -> list:
+    """
+    `count` free random Unique Plant IDs, e.g. ['798670', '051234'].
+    Random candidates with a reserve are checked with one query,
+    another one is needed only if the reserve was taken too.
+    IDs are not reserved: concurrent saving is guarded by the unique index of `Plant.uid`.
+    """
+    space = 10 ** UPID_DIGITS
+    upids = []
+    while len(upids) < count:
+        needed = count - len(upids)
+        candidates = [
+            str(number).zfill(UPID_DIGITS)
+            for number in random.sample(range(space), min(needed * 2 + 10, space))
+        ]
+        taken = set(Plant.objects.filter(uid__in=candidates).values_list('uid', flat=True))
+        taken.update(upids)
+        free = [upid for upid in candidates if upid not in taken]
+        if not free and Plant.objects.count() + len(upids) >= space:
+            raise RuntimeError('No free Unique Plant IDs left')
+        upids.extend(free[:needed])
+    return upids
+
+def filter_plants(plants, excluded_values: dict):
+    """
+    Filter plants queryset by current attribute values according to filtered data:
+    plant must not have any of excluded values of every attribute
+    """
+    schema = get_attribute_schema()
+    for attr_name, values in excluded_values.items():
+        if attr_name not in schema.keys:
+            continue
+        alias = f'attr_{attr_name}'
+        values = [str(val) for val in values]
+        if '' in values:
+            # attribute added after the plant state was built is empty too
+            condition = Q(**{f'{alias}__isnull': False}) & ~Q(**{f'{alias}__in': values})
+        else:
+            condition = Q(**{f'{alias}__isnull': True}) | ~Q(**{f'{alias}__in': values})
+        plants = plants.alias(**{alias: JSONKeyText('state__attrs', attr_name)}).filter(condition)
+    return plants
 
 def detect_data_matrix(image) -> list:
     """
@@ -232,138 +420,126 @@ def get_date_from_exif(image):
 
 # Attributes
 
-def get_filtered_attr_values_from_post(post_data) -> dict:
+def get_filter_query_from_post(post_data) -> dict:
     """
-    Convert post-data to filterable attrs dict:
+    Convert posted filter form to query string data. All values are checked
+    by default, so only unchecked ones are kept to make the url short:
 
     {
-        'genus': ['Lithops', 'Conophytum'], 
-        'species': ['karasmontana', 'Leslie'],
+        'exclude-genus': ['Conophytum'],
+        'exclude-species': ['karasmontana', 'Leslie'],
     }
     """
-    filter_data = {}
-
+    query = {}
     for key in post_data:
-        if 'checkbox' in key:
-            key = key.split('-')
-            attr_name = key[1]
-            attr_value = key[2]
+        if key.startswith('values-'):
+            attr_name = key[len('values-'):]
+            checked = set(post_data.getlist(f'checkbox-{attr_name}'))
+            excluded = [value for value in post_data.getlist(key) if value not in checked]
+            if excluded:
+                query[f'exclude-{attr_name}'] = excluded
+    return query
+
+def get_excluded_attr_values(query) -> dict:
+    """
+    Convert query string to dict of attribute values excluded by filters:
 
-            if attr_name in filter_data:
-                filter_data[attr_name].append(attr_value)
-            else:
-                filter_data[attr_name] = [attr_value, ]
-    return filter_data
+    {
+        'genus': ['Conophytum'],
+        'species': ['karasmontana', 'Leslie'],
+    }
+    """
+    return {key[len('exclude-'):]: query.getlist(key) for key in query if key.startswith('exclude-')}
 
-def get_filteraible_attr_values(rich_plants: list) -> dict:
+def get_filteraible_attr_values(plants, excluded_values=None) -> dict:
     """
-    Returns all availiable filterable attrs dict:
+    Returns all availiable filterable attrs dict with number of plants
+    for every value:
 
     {
         'genus': [
-                {'val':'lithops', 'checked':1},
-                {'val':'conophytum', 'checked':1}, 
-                {'val':'ophtalmophyllum', 'checked':1},
+                {'val':'lithops', 'count':12, 'checked':1},
+                {'val':'conophytum', 'count':3, 'checked':1}, 
+                {'val':'ophtalmophyllum', 'count':1, 'checked':1},
             ],
         'species':[
-                {'val':'karasmontana', 'checked':1},
-                {'val':'lesley', 'checked':1},
-                {'val':'dorothea', 'checked':1},
+                {'val':'karasmontana', 'count':5, 'checked':1},
+                {'val':'lesley', 'count':4, 'checked':0},
+                {'val':'dorothea', 'count':3, 'checked':1},
             ],
     }    
+
+    Counts of attribute values respect filters of all other attributes
     """
     filter_data = {}
+    schema = get_attribute_schema()
+    excluded_values = excluded_values or {}
 
     # generate blank structure with attr names
-    for attr_name in Attribute.keys.get_all_keys():
+    for attr_name in schema.keys:
         filter_data[attr_name] = []
 
-    used_values = {}
-
-    # fill
-    for rp in rich_plants: 
-        for attr_name in rp.attrs_as_dic:
-            if attr_name not in used_values:
-                used_values[attr_name] = []
-            if check_is_attr_filterable(attr_name):
-                value = rp.attrs_as_dic[attr_name]
-                if value not in used_values[attr_name]:
-                    filter_data[attr_name].append({'val':rp.attrs_as_dic[attr_name], 'checked':1})
-                    used_values[attr_name].append(value)
+    # values are counted by database, one query per attribute
+    for attr_name in schema.keys:
+        if attr_name not in schema.filterable:
+            continue
+        other_filters = {key: values for key, values in excluded_values.items() if key != attr_name}
+        values = (filter_plants(plants, other_filters)
+            .annotate(attr_value=Coalesce(JSONKeyText('state__attrs', attr_name), Value(''), output_field=TextField()))
+            .order_by('attr_value')
+            .values('attr_value')
+            .annotate(count=Count('id')))
+        for value in values:
+            filter_data[attr_name].append({'val':value['attr_value'], 'count':value['count'], 'checked':1})
+
+    if excluded_values:
+        filter_data = filter_data_update(filter_data, excluded_values)
     return filter_data
 
-def filter_data_update(full_filled_filter_data, post_filter_data):
-    # reset all checked status to 0 
-    for attr_name in full_filled_filter_data:
-        for d in full_filled_filter_data[attr_name]:
-            d['checked'] = 0
-
-    # set checked status to 1 as in posted data
-    for post_attr_name in post_filter_data:
-        for post_val in post_filter_data[post_attr_name]:
-            for d in full_filled_filter_data[post_attr_name]:
-                if d['val'] == post_val:
-                    d['checked'] = 1
+def filter_data_update(full_filled_filter_data, excluded_values):
+    # set checked status to 0 for excluded values
+    for attr_name in excluded_values:
+        if attr_name not in full_filled_filter_data:
+            continue
+        values = {d['val']: d for d in full_filled_filter_data[attr_name]}
+        for excluded_val in excluded_values[attr_name]:
+            if excluded_val in values:
+                values[excluded_val]['checked'] = 0
+            else:
+                # excluded value without plants left by other filters
+                full_filled_filter_data[attr_name].append({'val':excluded_val, 'count':0, 'checked':0})
 
     return full_filled_filter_data
 
-def check_is_attr_filterable(attr_key):
-    attr = Attribute.objects.get(key=attr_key)
-    return attr.filterable
-
-def check_is_attr_show_in_list(attr):
-    attr = Attribute.objects.get(key=attr_key)
-    return attr.show_in_list
-
-def get_attrs_titles_with_transl() -> dict:
-    """Returns attribut titles and translation"""
-    attr_titles = []
-    attrs = Attribute.objects.filter(show_in_list=True).order_by('weight')
-    for attr in attrs:
-        attr_titles.append(attr.name)
-
-    result = {}
-    for title in attr_titles:
-        result[title] = _(title)
-    return result
-
 def get_attr_keys_not_showing_in_list() -> list:
-    attrs = Attribute.objects.filter(show_in_list=False)
+    schema = get_attribute_schema()
     attr_keys = []
-    for attr in attrs:
-        attr_keys.append(attr.key)
+    for key in schema.keys:
+        if key not in schema.show_in_list:
+            attr_keys.append(key)
     return(attr_keys)
 
 
 # Users
 
-def check_are_users_friends(user_1, user_2):
-    """Check if one user is friend of another"""
-    if user_1 in user_2.friends.all():
-        return True
-    else:
-        return False
-
-def check_is_user_friend_of_plant_owner(user, target_rich_plant):
-    """Check if user is friend of Rich plant owner """
-    target_user = User.objects.get(id=target_rich_plant.owner)
-    if user in target_user.friends.all():
-        return True
-    else:
-        return False
-
-def check_is_user_owner_of_plant(user, target_rich_plant):
-    """Check if user is owner of Rich plant"""
-    if user.id == target_rich_plant.owner:
-        return True
-    else:
-        return False
+def get_not_owned_plant_ids(user, plant_ids) -> list:
+    """
+    Ids of plants from the list the user doesn't own (or not existing ones).
+    Empty list means user owns all plants. Checked with a single query.
+    """
+    plant_ids = set(plant_ids)
+    owned_ids = Plant.objects.filter(id__in=plant_ids, state__owner=user.id).values_list('id', flat=True)
+    return sorted(plant_ids - set(owned_ids))
 
 
 # Logs
 
-def create_log(action_type: Log.ActionChoices, user: User, plant: Plant, data: dict, action_time=None):
+def create_log(action_type: Log.ActionChoices, user: User, plant: Plant, data: dict, action_time=None, write_behind=False):
     """Create new log"""
+    create_logs([prepare_log(action_type, user, plant, data, action_time)], write_behind)
+
+def prepare_log(action_type: Log.ActionChoices, user: User, plant: Plant, data: dict, action_time=None) -> Log:
+    """New log with normalized data, not saved yet: see create_logs()"""
 
     for key in data:
         # selialize date fields
@@ -381,6 +557,39 @@ def create_log(action_type: Log.ActionChoices, user: User, plant: Plant, data: d
     )
 
     if action_time: 
+        # parse dates recieved as strings to compare with plant state
+        action_time = Log._meta.get_field('action_time').to_python(action_time)
+        if timezone.is_naive(action_time):
+            action_time = timezone.make_aware(action_time)
         new_log.action_time = action_time
-        
-    new_log.save()
\ No newline at end of file
+
+    return new_log
+
+def create_logs(logs: list, write_behind=False):
+    """
+    Save prepared logs (of one or many plants) with one query.
+    States and search documents of their plants are updated once per plant,
+    everything is written in one transaction.
+    With `write_behind` care events go to the spool if it's enabled (see plants.spool).
+    Logs are spooled only all together: a change written before its care event would
+    be backdated by the flush, so mixed batches are written right away.
+    """
+    if write_behind and logs and all(is_deferrable(log) for log in logs):
+        append_logs(logs)
+        return
+
+    if not logs:
+        return
+
+    with transaction.atomic():
+        # previous owners lose plants from collections
+        previous_owner_ids = []
+        owner_changed_ids = {log.plant_id for log in logs if 'owner' in log.data}
+        if owner_changed_ids:
+            previous_owner_ids = list(
+                PlantState.objects.filter(plant__in=owner_changed_ids).values_list('owner', flat=True)
+            )
+        Log.objects.bulk_create(logs)
+        states = update_plant_states(logs)
+        update_search_documents(logs, states)
+        invalidate_user_summaries(*previous_owner_ids, *(state.owner_id for state in states.values()))
\ No newline at end of file
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Attribute, Action
+from .schema import bump_schema_version
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+@receiver(post_save, sender=Action)
+@receiver(post_delete, sender=Action)
+@receiver(m2m_changed, sender=Action.related_attributes.through)
+def invalidate_attribute_schema(sender, **kwargs):
+    """Reload attribute schema in all workers after the change is committed"""
+    transaction.on_commit(bump_schema_version)
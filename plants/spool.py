@@ -0,0 +1,148 @@
+"""
+Write-behind spool of care events.
+
+When PLANT_LOG_SPOOL is set, logs which don't change plant state (actions
+and comments) can be appended to this file instead of being inserted
+right away, see create_logs(write_behind=True). Every append is fsynced,
+so accepted events survive restarts.
+
+`flush_log_spool` command moves them to the database in batches. The spool
+is renamed to `.flushing` first, new events go to a fresh file meanwhile.
+Number of flushed logs is saved in LogSpoolPosition in the transaction
+of every batch, so interrupted flush continues exactly where it stopped.
+
+Timeline reads pending events from the spool, so they are seen immediately.
+"""
+import json
+import os
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from .models import Log, LogSpoolPosition
+
+
+# keys of log data not changing plant attributes or owner
+DEFERRABLE_KEYS = {'action', 'comment'}
+
+
+def get_spool_path():
+    return getattr(settings, 'PLANT_LOG_SPOOL', None)
+
+
+def is_deferrable(log: Log) -> bool:
+    """Care events can wait in the spool: plant state doesn't depend on them"""
+    return bool(get_spool_path()) and set(log.data) <= DEFERRABLE_KEYS
+
+
+@contextmanager
+def spool_lock(shared=False, blocking=True, suffix='.lock'):
+    """Lock of spool files shared by all processes"""
+    # POSIX only, imported here to keep the app working on other systems with the spool disabled
+    import fcntl
+    with open(get_spool_path() + suffix, 'a') as lock_file:
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        fcntl.flock(lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def serialize_log(log: Log) -> str:
+    return json.dumps({
+        'action_type': log.action_type,
+        'user': log.user_id,
+        'plant': log.plant_id,
+        'data': log.data,
+        'action_time': log.action_time.isoformat(),
+    }, ensure_ascii=False) + '\n'
+
+
+def deserialize_log(line: str) -> Log:
+    entry = json.loads(line)
+    return Log(
+        action_type=entry['action_type'],
+        user_id=entry['user'],
+        plant_id=entry['plant'],
+        data=entry['data'],
+        action_time=parse_datetime(entry['action_time']),
+    )
+
+
+def append_logs(logs: list):
+    """Durably append logs to the spool"""
+    lines = ''.join(serialize_log(log) for log in logs).encode()
+    with spool_lock():
+        with open(get_spool_path(), 'ab+') as f:
+            # line cut by crash during writing must not swallow the next one
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    lines = b'\n' + lines
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_logs(path: str) -> list:
+    """Logs from spool file, broken lines are ignored"""
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+
+    logs = []
+    for line in lines:
+        try:
+            logs.append(deserialize_log(line))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return logs
+
+
+def get_flushed_count() -> int:
+    position = LogSpoolPosition.objects.filter(path=get_spool_path()).first()
+    return position.flushed_count if position else 0
+
+
+def set_flushed_count(count: int):
+    """Call it in the transaction writing the flushed logs"""
+    LogSpoolPosition.objects.update_or_create(path=get_spool_path(), defaults={'flushed_count': count})
+
+
+def get_pending_logs(plant_id=None) -> list:
+    """Logs waiting in the spool (only of the plant if its id is passed), oldest first"""
+    path = get_spool_path()
+    if not path:
+        return []
+    with spool_lock(shared=True):
+        logs = read_logs(path + '.flushing')[get_flushed_count():] + read_logs(path)
+    if plant_id is not None:
+        logs = [log for log in logs if log.plant_id == plant_id]
+    return sorted(logs, key=lambda log: log.action_time)
+
+
+def take_spool() -> list:
+    """
+    Logs to flush: left by interrupted flush (see get_flushed_count()) or all pending ones
+    """
+    path = get_spool_path()
+    with spool_lock():
+        if not os.path.exists(path + '.flushing'):
+            if not os.path.exists(path):
+                return []
+            # reset before renaming: a count left from the previous file must not skip logs
+            set_flushed_count(0)
+            os.replace(path, path + '.flushing')
+    return read_logs(path + '.flushing')
+
+
+def release_spool():
+    """Taken file is flushed completely"""
+    path = get_spool_path()
+    with spool_lock():
+        os.remove(path + '.flushing')
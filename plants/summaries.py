@@ -0,0 +1,49 @@
+import json
+import uuid
+import hashlib
+from django.core.cache import cache
+from django.db import transaction
+from .schema import get_schema_version
+
+
+SUMMARY_VERSION_CACHE_KEY = 'plants:summary_version:%s'
+
+# summaries of changed collections are not read anyway, old ones just expire
+SUMMARY_TIMEOUT = 60 * 60 * 24
+
+
+def get_summary_version(user_id) -> str:
+    """Current version of summaries of user's collection"""
+    key = SUMMARY_VERSION_CACHE_KEY % user_id
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_cached_summary(user_id, name: str, params, compute):
+    """
+    Summary of user's collection (group counts, facets, totals) from the cache.
+    `params` - anything the summary depends on besides the collection, e.g. access types.
+    `compute` - function returning the summary on cache miss.
+    """
+    params_hash = hashlib.md5(
+        json.dumps([params, get_schema_version()], sort_keys=True, default=str).encode()
+    ).hexdigest()
+    key = f'plants:summary:{user_id}:{get_summary_version(user_id)}:{name}:{params_hash}'
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute()
+        cache.set(key, summary, timeout=SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_user_summaries(*user_ids):
+    """Summaries of users' collections are recomputed after the current transaction is committed"""
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        transaction.on_commit(
+            lambda user_id=user_id: cache.set(SUMMARY_VERSION_CACHE_KEY % user_id, uuid.uuid4().hex, timeout=None)
+        )
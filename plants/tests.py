@@ -1,3 +1,524 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, IntegrityError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from users.models import User
+from .models import Attribute, Log, LogSpoolPosition, Plant, PlantState
+from .projections import build_plant_state, get_snapshots
+from .schema import bump_schema_version
+from .spool import append_logs, get_pending_logs, take_spool, release_spool
+from .exports import export_plants
+from .services import get_user_plants, filter_plants_by_attrs, get_plant_timeline_page, encode_page_cursor, \
+                      create_new_plant, create_log, create_logs, prepare_log, get_sorted_plants, get_plants_page, \
+                      filter_plants, get_filteraible_attr_values, get_new_upids
 
-# Create your tests here.
+
+def create_attributes(test_case, attributes, value_types=None):
+    """Attributes (key, name, short name) for the test, STRING unless a type is given by key"""
+    value_types = value_types or {}
+    for weight, (key, name, short_name) in enumerate(attributes):
+        Attribute.objects.create(key=key, name=name, short_name=short_name, weight=weight, filterable=True,
+                                 value_type=value_types.get(key, Attribute.AttributeTypeChoices.STRING))
+    # schema is reloaded after commit, test transaction is never committed
+    bump_schema_version()
+    test_case.addCleanup(bump_schema_version)
+
+
+class QueryPlanTests(TestCase):
+    """Hot querysets must use indexes instead of table scans"""
+
+    def setUp(self):
+        # on a tiny table PostgreSQL prefers sequential scan anyway
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, msg=f'{index_name} is not used:\n{queryset.query}\n{plan}')
+
+    def assertQueriesUseIndex(self, function, index_name):
+        """Some query made by the function uses the index"""
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(connection.ops.explain_query_prefix() + ' ' + query['sql'])
+                plans.append('\n'.join(str(row) for row in cursor.fetchall()))
+        self.assertTrue(any(index_name in plan for plan in plans), msg=f'{index_name} is not used:\n' + '\n'.join(plans))
+
+    def test_plant_timeline(self):
+        plant = Plant.objects.create(uid='000001')
+        cursor = encode_page_cursor(timezone.now(), 1)
+        self.assertQueriesUseIndex(lambda: get_plant_timeline_page(plant), 'log_plant_time_idx')
+        self.assertQueriesUseIndex(lambda: get_plant_timeline_page(plant, cursor), 'log_plant_time_idx')
+
+    def test_user_plants(self):
+        self.assertUsesIndex(get_user_plants(1), 'plantstate_owner_id')
+
+    def test_plants_by_genus(self):
+        plants = filter_plants_by_attrs(Plant.objects.all(), {'genus': 'Lithops'})
+        self.assertUsesIndex(plants, 'plantstate_genus_idx')
+
+
+@override_settings(PLANT_SNAPSHOT_INTERVAL=3)
+class PlantStateTests(TestCase):
+    """State updated by every new log is the same as replayed from all logs"""
+
+    def setUp(self):
+        create_attributes(self, [('genus', 'Genus', 'gen.'), ('species', 'Species', 'sp.'), ('height', 'Height', 'h')])
+        self.user = User.objects.create_user('grower', password='pw')
+        self.start = timezone.now() - timedelta(days=100)
+
+    def create_plant(self, genus) -> Plant:
+        plant = create_new_plant(self.user)
+        create_log(Log.ActionChoices.ADDITION, self.user, plant, {'owner': self.user.id, 'genus': genus}, self.start)
+        return plant
+
+    def assertStateIsRebuilt(self, plant):
+        state = PlantState.objects.get(plant=plant)
+        logs = list(Log.objects.filter(plant=plant))
+        for from_snapshot in (True, False):
+            rebuilt = build_plant_state(plant.id, logs, from_snapshot=from_snapshot)
+            self.assertEqual(
+                (state.owner_id, state.attrs, state.fancy_name, state.last_changed),
+                (rebuilt.owner_id, rebuilt.attrs, rebuilt.fancy_name, rebuilt.last_changed),
+            )
+        self.assertEqual(state.logs_since_snapshot, build_plant_state(plant.id, logs).logs_since_snapshot)
+
+    def test_incremental_update(self):
+        plant = self.create_plant('Lithops')
+        for day in range(1, 8):
+            data = {'species': f'species {day}'} if day % 2 else {'height': str(day)}
+            create_log(Log.ActionChoices.CHANGE, self.user, plant, data, self.start + timedelta(days=day))
+            self.assertStateIsRebuilt(plant)
+
+        state = PlantState.objects.get(plant=plant)
+        self.assertEqual(state.attrs, {'genus': 'Lithops', 'species': 'species 7', 'height': '6'})
+        self.assertEqual(get_snapshots(plant.id).count(), 2)
+
+    def test_backdated_log(self):
+        plant = self.create_plant('Lithops')
+        for day in range(1, 8):
+            create_log(Log.ActionChoices.CHANGE, self.user, plant, {'species': f'species {day}'},
+                       self.start + timedelta(days=day))
+        self.assertEqual(get_snapshots(plant.id).count(), 2)
+
+        backdated_time = self.start + timedelta(days=2, hours=12)
+        create_log(Log.ActionChoices.CHANGE, self.user, plant, {'height': '5', 'species': 'old species'}, backdated_time)
+
+        # snapshots after the backdated log don't include it
+        self.assertFalse(get_snapshots(plant.id).filter(action_time__gt=backdated_time).exists())
+        self.assertStateIsRebuilt(plant)
+        state = PlantState.objects.get(plant=plant)
+        self.assertEqual(state.attrs, {'genus': 'Lithops', 'species': 'species 7', 'height': '5'})
+        self.assertEqual(state.last_changed, self.start + timedelta(days=7))
+
+    def test_batch_of_many_plants(self):
+        plants = [self.create_plant(genus) for genus in ('Lithops', 'Conophytum', 'Haworthia')]
+        logs = [
+            prepare_log(Log.ActionChoices.CHANGE, self.user, plant, {'height': str(day)}, self.start + timedelta(days=day))
+            for day in range(1, 3)
+            for plant in plants
+        ]
+
+        bulk_update = PlantState.objects.bulk_update
+        with mock.patch.object(PlantState.objects, 'bulk_update', wraps=bulk_update) as mocked_bulk_update:
+            create_logs(logs)
+
+        updated_ids = [state.plant_id for call in mocked_bulk_update.call_args_list for state in call.args[0]]
+        self.assertCountEqual(updated_ids, [plant.id for plant in plants])
+        for plant in plants:
+            self.assertStateIsRebuilt(plant)
+            self.assertEqual(PlantState.objects.get(plant=plant).attrs['height'], '2')
+
+
+class PlantListPageTests(TestCase):
+    """Plant list is sorted by attribute values and read page by page"""
+
+    def setUp(self):
+        create_attributes(self, [('genus', 'Genus', 'gen.'), ('pot_width', 'Pot width', 'pw')],
+                          {'pot_width': Attribute.AttributeTypeChoices.NUMBER})
+        self.user = User.objects.create_user('grower', password='pw')
+        # JSON numbers and typed strings are both stored
+        self.widths = [11, '12.6', '9', '', None, 'no pot', ' 7.5 cm', -1]
+        self.plants = []
+        for i, width in enumerate(self.widths):
+            plant = create_new_plant(self.user)
+            data = {'owner': self.user.id, 'genus': f'Genus {i % 3}'}
+            if width is not None:
+                data['pot_width'] = width
+            create_log(Log.ActionChoices.ADDITION, self.user, plant, data)
+            self.plants.append(plant)
+
+    def get_all_pages(self, sort, page_size=3) -> list:
+        plant_ids, cursor = [], None
+        while True:
+            plant_rows, cursor = get_plants_page(get_user_plants(self.user.id), sort, cursor, page_size)
+            plant_ids += [plant_row.id for plant_row in plant_rows]
+            if cursor is None:
+                return plant_ids
+
+    def test_number_attribute_order(self):
+        plants = get_sorted_plants(get_user_plants(self.user.id), 'pot_width')
+        # values without number first, as empty text values are
+        no_number = [plant.id for plant, width in zip(self.plants, self.widths) if width in ('', None, 'no pot')]
+        by_number = [self.plants[i].id for i in (7, 6, 2, 0, 1)]
+        self.assertEqual([plant.id for plant in plants], no_number + by_number)
+
+        plants = get_sorted_plants(get_user_plants(self.user.id), '-pot_width')
+        self.assertEqual([plant.id for plant in plants], (no_number + by_number)[::-1])
+
+    def test_pages_are_the_same_as_sorted_list(self):
+        for sort in ('uid', '-uid', 'creation_date', '-creation_date', 'genus', '-genus', 'pot_width', '-pot_width'):
+            with self.subTest(sort=sort):
+                expected = [plant.id for plant in get_sorted_plants(get_user_plants(self.user.id), sort)]
+                self.assertEqual(self.get_all_pages(sort), expected)
+
+    def test_pages_with_the_same_creation_date(self):
+        Plant.objects.update(creation_date=timezone.now())
+        plant_ids = sorted(plant.id for plant in self.plants)
+        self.assertEqual(self.get_all_pages('creation_date', page_size=2), plant_ids)
+        self.assertEqual(self.get_all_pages('-creation_date', page_size=2), plant_ids[::-1])
+
+
+class LogSpoolTests(TestCase):
+    """Care events wait in the spool file and are flushed to the database exactly once"""
+
+    def setUp(self):
+        create_attributes(self, [('genus', 'Genus', 'gen.'), ('height', 'Height', 'h')])
+        self.user = User.objects.create_user('grower', password='pw')
+        self.plant = create_new_plant(self.user)
+        create_log(Log.ActionChoices.ADDITION, self.user, self.plant, {'owner': self.user.id, 'genus': 'Lithops'})
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_path = os.path.join(directory.name, 'spool.jsonl')
+        spool_settings = override_settings(PLANT_LOG_SPOOL=self.spool_path)
+        spool_settings.enable()
+        self.addCleanup(spool_settings.disable)
+
+    def care_event(self, comment, plant=None) -> Log:
+        return prepare_log(Log.ActionChoices.ADDITION, self.user, plant or self.plant,
+                           {'action': 'watering', 'comment': comment})
+
+    def get_comments(self) -> list:
+        return list(Log.objects.filter(data__has_key='comment').order_by('id').values_list('data__comment', flat=True))
+
+    def flush(self, **options) -> str:
+        out = StringIO()
+        call_command('flush_log_spool', stdout=out, **options)
+        return out.getvalue()
+
+    def test_take_and_release(self):
+        append_logs([self.care_event('first')])
+        self.assertEqual(len(take_spool()), 1)
+        self.assertTrue(os.path.exists(self.spool_path + '.flushing'))
+
+        # new events go to a fresh file, the taken one is returned again until released
+        append_logs([self.care_event('second')])
+        self.assertEqual([log.data['comment'] for log in take_spool()], ['first'])
+        self.assertEqual([log.data['comment'] for log in get_pending_logs()], ['first', 'second'])
+
+        release_spool()
+        self.assertFalse(os.path.exists(self.spool_path + '.flushing'))
+        self.assertEqual([log.data['comment'] for log in take_spool()], ['second'])
+
+    def test_only_care_events_are_spooled(self):
+        create_logs([self.care_event('spooled')], write_behind=True)
+        self.assertEqual(self.get_comments(), [])
+        self.assertEqual(len(get_pending_logs(self.plant.id)), 1)
+
+        # care event with attribute change is written with it
+        change = prepare_log(Log.ActionChoices.CHANGE, self.user, self.plant, {'height': '5'})
+        create_logs([self.care_event('written'), change], write_behind=True)
+        self.assertEqual(self.get_comments(), ['written'])
+        self.assertEqual(PlantState.objects.get(plant=self.plant).attrs['height'], '5')
+        self.assertEqual(len(get_pending_logs(self.plant.id)), 1)
+
+    def test_pending_logs_on_timeline(self):
+        create_log(Log.ActionChoices.ADDITION, self.user, self.plant, {'action': 'watering', 'comment': 'new'},
+                   write_behind=True)
+        cards, next_cursor = get_plant_timeline_page(self.plant)
+        self.assertEqual(cards[0].text, 'new')
+        self.assertIsNone(cards[0].id)
+
+        self.flush()
+        cards, next_cursor = get_plant_timeline_page(self.plant)
+        self.assertEqual([card.text for card in cards].count('new'), 1)
+        self.assertIsNotNone(cards[0].id)
+
+    def test_flush(self):
+        deleted_plant = create_new_plant(self.user)
+        append_logs([self.care_event(f'event {i}') for i in range(5)] + [self.care_event('lost', deleted_plant)])
+        deleted_plant.delete()
+
+        output = self.flush(batch_size=2)
+        self.assertIn('5 logs were flushed, 1 logs of deleted plants dropped', output)
+        self.assertEqual(self.get_comments(), [f'event {i}' for i in range(5)])
+        self.assertEqual(get_pending_logs(), [])
+        self.assertFalse(os.path.exists(self.spool_path + '.flushing'))
+
+    def test_interrupted_flush_resumes(self):
+        append_logs([self.care_event(f'event {i}') for i in range(5)])
+
+        # process dies after the second batch is written, before its position is saved
+        # (position is reset by take_spool() and saved after every batch)
+        update_or_create = LogSpoolPosition.objects.update_or_create
+        calls = []
+        def crash_on_second_batch(*args, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 3:
+                raise RuntimeError('crash')
+            return update_or_create(*args, **kwargs)
+
+        with mock.patch.object(LogSpoolPosition.objects, 'update_or_create', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.flush(batch_size=2)
+
+        # batch of the failed transaction is not written
+        self.assertEqual(self.get_comments(), ['event 0', 'event 1'])
+        self.assertEqual(LogSpoolPosition.objects.get(path=self.spool_path).flushed_count, 2)
+        self.assertEqual(len(get_pending_logs()), 3)
+
+        self.flush(batch_size=2)
+        self.assertEqual(self.get_comments(), [f'event {i}' for i in range(5)])
+
+
+class SearchTests(TestCase):
+    """Search finds plants by attributes and comments, only among plants visible to the user"""
+
+    def setUp(self):
+        create_attributes(self, [('genus', 'Genus', 'gen.')])
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.friend = User.objects.create_user('friend', password='pw')
+        self.stranger = User.objects.create_user('stranger', password='pw')
+        self.owner.friends.add(self.friend)
+
+        self.plants = {}
+        for access_type in Plant.AccessTypeChoices:
+            plant = create_new_plant(self.owner)
+            plant.access_type = access_type
+            plant.save()
+            create_log(Log.ActionChoices.ADDITION, self.owner, plant, {'owner': self.owner.id, 'genus': 'Lithops'})
+            create_log(Log.ActionChoices.ADDITION, self.owner, plant, {'action': 'watering', 'comment': 'yellow leaves'})
+            self.plants[access_type] = plant
+
+    def search(self, user, query) -> set:
+        if user is not None:
+            self.client.force_login(user)
+        response = self.client.get(reverse('plant_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return {plant_row.id for plant_row in response.context['plant_rows']}
+
+    def test_search_respects_access(self):
+        public, friends, private = (self.plants[access_type] for access_type in Plant.AccessTypeChoices)
+        visible = {
+            'anonymous': {public.id},
+            'stranger': {public.id},
+            'friend': {public.id, friends.id},
+            'owner': {public.id, friends.id, private.id},
+        }
+        users = {'anonymous': None, 'stranger': self.stranger, 'friend': self.friend, 'owner': self.owner}
+        for user_name, user in users.items():
+            for query in ('lithops', 'yellow leav', private.uid):
+                with self.subTest(user=user_name, query=query):
+                    expected = visible[user_name] if query != private.uid else visible[user_name] & {private.id}
+                    self.assertEqual(self.search(user, query), expected)
+            self.client.logout()
+
+
+class ImportPlantsTests(TestCase):
+    """import_plants command creates plants of the user from csv file"""
+
+    def setUp(self):
+        create_attributes(self, [('genus', 'Genus', 'gen.'), ('species', 'Species', 'sp.')])
+        self.user = User.objects.create_user('grower', password='pw')
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.csv_path = os.path.join(directory.name, 'plants.csv')
+
+    def import_csv(self, text, *args) -> str:
+        with open(self.csv_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        out = StringIO()
+        call_command('import_plants', self.csv_path, '--user', str(self.user.id), *args, stdout=out)
+        return out.getvalue()
+
+    def get_imported(self) -> list:
+        states = PlantState.objects.filter(owner=self.user).select_related('plant').order_by('plant')
+        return [(state.plant.is_seed, state.attrs) for state in states]
+
+    def test_export_with_logs_is_imported(self):
+        owner = User.objects.create_user('owner', password='pw')
+        plant = create_new_plant(owner)
+        create_log(Log.ActionChoices.ADDITION, owner, plant, {'owner': owner.id, 'genus': 'Lithops', 'species': 'aucampiae'})
+        # long history doesn't fit default csv field size
+        create_log(Log.ActionChoices.ADDITION, owner, plant, {'action': 'watering', 'comment': 'x' * 200000})
+
+        self.import_csv(''.join(export_plants(Plant.objects.filter(id=plant.id), 'csv', with_logs=True)))
+        self.assertEqual(self.get_imported(), [(False, {'genus': 'Lithops', 'species': 'aucampiae'})])
+
+
+    def test_batches_are_imported(self):
+        output = self.import_csv(
+            'genus;species;is_seed\n'
+            'Lithops;aucampiae;\n'
+            'Lithops ; lesliei;yes\n'
+            'Conophytum;;0\n',
+            '--batch-size', '2',
+        )
+        self.assertIn('3 plants were imported', output)
+        self.assertEqual(self.get_imported(), [
+            (False, {'genus': 'Lithops', 'species': 'aucampiae'}),
+            (True, {'genus': 'Lithops', 'species': 'lesliei'}),
+            (False, {'genus': 'Conophytum', 'species': ''}),
+        ])
+        self.assertEqual(Log.objects.filter(user=self.user, action_type=Log.ActionChoices.ADDITION).count(), 3)
+
+    def test_taken_upids_are_retried(self):
+        taken_plant = create_new_plant(self.user)
+        with mock.patch('plants.management.commands.import_plants.get_new_upids',
+                        side_effect=[[taken_plant.uid, '000001'], ['000002', '000003']]):
+            self.import_csv('genus\nLithops\nConophytum\n')
+        self.assertCountEqual(Plant.objects.exclude(id=taken_plant.id).values_list('uid', flat=True), ['000002', '000003'])
+
+    def test_dry_run(self):
+        output = self.import_csv('genus;is_seed\nLithops;\nConophytum;1\n', '--dry-run')
+        self.assertIn('2 plants are valid, nothing was written', output)
+        self.assertFalse(Plant.objects.exists())
+        self.assertFalse(Log.objects.exists())
+
+    def test_unknown_column(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown columns: family'):
+            self.import_csv('genus;family\nLithops;Aizoaceae\n')
+        self.assertFalse(Plant.objects.exists())
+
+    def test_wrong_is_seed(self):
+        text = 'genus;is_seed\nLithops;\nConophytum;\nTitanopsis;maybe\n'
+        with self.assertRaisesMessage(CommandError, 'Line 4: wrong is_seed value "maybe"'):
+            self.import_csv(text, '--dry-run')
+        self.assertFalse(Plant.objects.exists())
+
+        # batches before the wrong line are already written
+        with self.assertRaisesMessage(CommandError, '2 plants were imported before'):
+            self.import_csv(text, '--batch-size', '2')
+        self.assertEqual([attrs['genus'] for is_seed, attrs in self.get_imported()], ['Lithops', 'Conophytum'])
+
+
+class FilterTests(TestCase):
+    """Plant list is filtered by excluding unchecked attribute values"""
+
+    def setUp(self):
+        create_attributes(self, [('genus', 'Genus', 'gen.'), ('species', 'Species', 'sp.')])
+        # summaries of users are cached
+        cache.clear()
+        self.user = User.objects.create_user('grower', password='pw')
+        self.lithops = self.create_plant(genus='Lithops', species='aucampiae')
+        self.lithops_no_species = self.create_plant(genus='Lithops', species='')
+        self.conophytum = self.create_plant(genus='Conophytum')
+        self.no_genus = self.create_plant(species='bilobum')
+        # species attribute was added after the state was built
+        PlantState.objects.filter(plant=self.conophytum).update(attrs={'genus': 'Conophytum'})
+
+    def create_plant(self, **attrs) -> Plant:
+        plant = create_new_plant(self.user)
+        create_log(Log.ActionChoices.ADDITION, self.user, plant, {'owner': self.user.id, **attrs})
+        return plant
+
+    def filter(self, excluded_values) -> set:
+        return set(filter_plants(get_user_plants(self.user.id), excluded_values).values_list('id', flat=True))
+
+    def test_excluded_values(self):
+        self.assertEqual(self.filter({'genus': ['Lithops']}), {self.conophytum.id, self.no_genus.id})
+        # plants without the attribute have empty value
+        self.assertEqual(self.filter({'species': ['']}), {self.lithops.id, self.no_genus.id})
+        self.assertEqual(self.filter({'species': ['aucampiae']}),
+                         {self.lithops_no_species.id, self.conophytum.id, self.no_genus.id})
+        self.assertEqual(self.filter({'genus': ['', 'Conophytum'], 'species': ['']}), {self.lithops.id})
+        self.assertEqual(self.filter({'unknown': ['Lithops']}), self.filter({}))
+
+    def test_filter_form(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('plants'), {
+            'sort': 'uid',
+            'values-genus': ['', 'Conophytum', 'Lithops'],
+            'checkbox-genus': ['Lithops'],
+            'values-species': ['', 'aucampiae', 'bilobum'],
+            'checkbox-species': ['', 'aucampiae', 'bilobum'],
+        })
+        # only unchecked values are kept in the url
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('plants') + '?exclude-genus=&exclude-genus=Conophytum&sort=uid')
+
+        response = self.client.get(response['Location'])
+        plant_ids = [plant_row.id for plant_row in response.context['plant_rows']]
+        self.assertCountEqual(plant_ids, [self.lithops.id, self.lithops_no_species.id])
+        checked = {value['val']: value['checked'] for value in response.context['filter_attrs']['genus']}
+        self.assertEqual(checked, {'': 0, 'Conophytum': 0, 'Lithops': 1})
+
+        # all values checked
+        response = self.client.post(reverse('plants'), {'values-genus': ['Lithops'], 'checkbox-genus': ['Lithops']})
+        self.assertEqual(response['Location'], reverse('plants'))
+
+    def test_facet_counts(self):
+        facets = get_filteraible_attr_values(get_user_plants(self.user.id), {'genus': ['Conophytum'], 'species': ['bilobum']})
+        # values of every attribute are counted with filters of other attributes only
+        self.assertEqual(facets['genus'], [
+            {'val': 'Conophytum', 'count': 1, 'checked': 0},
+            {'val': 'Lithops', 'count': 2, 'checked': 1},
+        ])
+        self.assertEqual(facets['species'], [
+            {'val': '', 'count': 1, 'checked': 1},
+            {'val': 'aucampiae', 'count': 1, 'checked': 1},
+            {'val': 'bilobum', 'count': 1, 'checked': 0},
+        ])
+
+        # excluded value without plants left by other filters is still shown
+        facets = get_filteraible_attr_values(get_user_plants(self.user.id), {'genus': ['', 'Conophytum', 'Lithops'], 'species': ['rare']})
+        self.assertIn({'val': 'rare', 'count': 0, 'checked': 0}, facets['species'])
+        self.assertEqual(sum(value['count'] for value in facets['species']), 0)
+
+
+class UpidTests(TestCase):
+    """Unique Plant IDs are random, allocated in batches and guarded by the unique index"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('grower', password='pw')
+
+    def test_batch(self):
+        upids = get_new_upids(500)
+        self.assertEqual(len(set(upids)), 500)
+        self.assertTrue(all(len(upid) == 6 and upid.isdigit() for upid in upids))
+
+    @mock.patch('plants.services.UPID_DIGITS', 2)
+    def test_batch_skips_taken(self):
+        Plant.objects.bulk_create([Plant(uid=str(number).zfill(2), creator=self.user) for number in range(90)])
+        self.assertCountEqual(get_new_upids(10), [str(number) for number in range(90, 100)])
+
+        Plant.objects.bulk_create([Plant(uid=str(number), creator=self.user) for number in range(90, 100)])
+        with self.assertRaises(RuntimeError):
+            get_new_upids(1)
+
+    def test_taken_upid_is_retried(self):
+        taken_plant = create_new_plant(self.user)
+        with mock.patch('plants.services.get_new_upid', side_effect=[taken_plant.uid, '000001']) as get_new_upid:
+            plant = create_new_plant(self.user)
+        self.assertEqual(get_new_upid.call_count, 2)
+        self.assertEqual(plant.uid, '000001')
+
+        with mock.patch('plants.services.get_new_upid', return_value=taken_plant.uid):
+            with self.assertRaises(IntegrityError):
+                create_new_plant(self.user)
+        self.assertEqual(Plant.objects.filter(uid=taken_plant.uid).count(), 1)
@@ -1,44 +1,82 @@
+import itertools
+from urllib.parse import urlencode
 from django.shortcuts import render, get_object_or_404, redirect, reverse
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseForbidden, Http404, StreamingHttpResponse
 from django.template import loader
 from django.utils.translation import gettext as _
 from django.utils.translation import activate
-from django.utils import translation
+from django.utils import translation, timezone
 from django.contrib.auth import authenticate, login
 from django.core.exceptions import PermissionDenied
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 from users.forms import UserCreateForm
 from users.models import User
-from .models import Plant, Log, Attribute, Action, Photo, user_directory_path
+from .models import Plant, Log, Action, Photo, user_directory_path
 from .forms import PlantForm, AttributeForm, ActionForm, PhotoForm
-from .services import   get_user_richplants, \
-                        get_attrs_titles_with_transl, \
-                        check_is_user_friend_of_plant_owner, \
-                        check_is_user_owner_of_plant, \
+from .services import   get_user_plants, get_plant_groups, search_plant_rows, get_plants_page, \
+                        get_plant_timeline_page, \
+                        get_plant_sort_keys, get_list_columns, get_sorted_plants, \
                         get_filteraible_attr_values, \
-                        get_filtered_attr_values_from_post, \
-                        filter_data_update,\
+                        get_filter_query_from_post, get_excluded_attr_values, \
                         filter_plants, get_attr_keys_not_showing_in_list, \
-                        create_log, create_new_plant, detect_data_matrix, \
+                        create_log, create_logs, prepare_log, create_new_plant, detect_data_matrix, \
                         get_date_from_exif
-from users.services import is_friend
-from .entities import RichPlant, BrCr, GenusForGroups, TagForGroups
+from .entities import RichPlant, PlantRow, BrCr
+from .schema import get_attribute_schema
+from .summaries import get_cached_summary
+from .exports import EXPORT_FORMATS, export_plants
+from .permissions import get_plant_permissions
 from api.serializers import PlantSerializer, UserSerializer
-from taggit.models import Tag
 
 
 # https://docs.djangoproject.com/en/3.2/topics/auth/default/#the-login-required-decorator
 from django.contrib.auth.decorators import login_required
 
 
-def index(request, user_id=None, genus=None, tag_id=None, is_seed=None):
+# plant list order if nothing is chosen
+DEFAULT_PLANT_SORT = 'creation_date'
+
+# place of streamed rows in the plant list page
+PLANT_ROWS_MARKER = '<!-- plant rows -->'
+
+
+def get_sort_link(request, sort, key) -> dict:
+    """Url of the list sorted by the key (reversed on the second click) and current direction"""
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    query['sort'] = f'-{key}' if sort == key else key
+    direction = 'asc' if sort == key else 'desc' if sort == f'-{key}' else ''
+    return {'url': f'{request.path}?{query.urlencode()}', 'direction': direction}
+
+
+def index(request, user_id=None, genus=None, tag_id=None, is_seed=None, attr_key=None, attr_value=None):
     """List of User/Someones Plants"""
 
-    # get filter data recieved from POST
-    post_filter_data = False
+    # attribute values from url
+    route_attrs = {}
+    if genus:
+        route_attrs['genus'] = genus
+    if attr_key:
+        if attr_key not in get_attribute_schema().keys:
+            raise Http404
+        route_attrs[attr_key] = attr_value
+
+    # posted filters are moved to short query string with unchecked values only
     if request.method == 'POST':
-        post_filter_data = get_filtered_attr_values_from_post(request.POST)
+        query = get_filter_query_from_post(request.POST)
+        if request.POST.get('sort'):
+            query['sort'] = request.POST['sort']
+        return redirect(f'{request.path}?{urlencode(query, doseq=True)}' if query else request.path)
+
+    # get filter data recieved from query string
+    excluded_values = get_excluded_attr_values(request.GET)
+
+    # sorting and page position
+    sort = request.GET.get('sort', DEFAULT_PLANT_SORT)
+    if sort.lstrip('-') not in get_plant_sort_keys():
+        sort = DEFAULT_PLANT_SORT
+    cursor = request.GET.get('cursor')
     
     # Breadcrumbs data
     brcr = BrCr()
@@ -49,7 +87,8 @@ def index(request, user_id=None, genus=None, tag_id=None, is_seed=None):
         current_user = request.user
         if current_user.is_authenticated:
             user_id = current_user.id
-            rich_plants = get_user_richplants(user_id, genus=genus, tag_id=tag_id, seeds=is_seed)
+            access = []
+            plants = get_user_plants(user_id, tag_id=tag_id, seeds=is_seed, attrs=route_attrs)
             # Translators: Section name
             section_name = _('MyPlants')
             user_name = current_user.username
@@ -64,46 +103,145 @@ def index(request, user_id=None, genus=None, tag_id=None, is_seed=None):
         target_user = get_object_or_404(User, id=user_id)
         current_user = request.user
         # for friend
-        if current_user.is_authenticated and is_friend(current_user, target_user):
+        if get_plant_permissions(request).is_friend_of(target_user.id):
             access = [Plant.AccessTypeChoices.PUBLIC, Plant.AccessTypeChoices.FRIENDS]
-            rich_plants = get_user_richplants(user_id, access=access, genus=genus, tag_id=tag_id, seeds=is_seed)
+            plants = get_user_plants(user_id, access=access, tag_id=tag_id, seeds=is_seed, attrs=route_attrs)
         # for anonymous
         else:
             access = [Plant.AccessTypeChoices.PUBLIC,]
-            rich_plants = get_user_richplants(user_id, access=access, genus=genus, tag_id=tag_id, seeds=is_seed)
+            plants = get_user_plants(user_id, access=access, tag_id=tag_id, seeds=is_seed, attrs=route_attrs)
         section_name = _('PlantsOfUser') 
         user_name = target_user.username
         is_owner = False
         brcr.add_level(True, '', f'{section_name}: {user_name}')
         
-    # Attribute titles
-    attrs_titles_with_transl = get_attrs_titles_with_transl()
-    
     # Not showing attribute keys
     attrs_not_showing = get_attr_keys_not_showing_in_list()
 
     # Filter
-    filter_data = get_filteraible_attr_values(rich_plants)
-    if post_filter_data: 
-        filter_data = filter_data_update(filter_data, post_filter_data)
-        rich_plants = filter_plants(rich_plants, post_filter_data)
+    filtered_plants = filter_plants(plants, excluded_values) if excluded_values else plants
+
+    # Page, or all plants streamed after the page head
+    streaming = request.GET.get('stream') == '1'
+    plant_rows, next_cursor = [], None
+    if not streaming:
+        try:
+            plant_rows, next_cursor = get_plants_page(filtered_plants, sort, cursor)
+        except ValueError:
+            raise Http404
+    next_url = stream_url = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        query.pop('fragment', None)
+        next_url = f'{request.path}?{query.urlencode()}'
+        query.pop('cursor')
+        query['stream'] = '1'
+        stream_url = f'{request.path}?{query.urlencode()}'
+
+    # "load more" requests only rows of the next page
+    if request.GET.get('fragment') == 'rows':
+        context = {
+            'plant_rows': plant_rows,
+            'attrs_not_showing': attrs_not_showing,
+        }
+        template = loader.get_template('plants/index_rows.html')
+        response = HttpResponse(template.render(context, request))
+        response['X-Next-Page'] = next_url or ''
+        return response
+
+    # facets and total are cached until the collection changes
+    summary = get_cached_summary(
+        user_id, 'plant_list', [access, tag_id, is_seed, route_attrs, excluded_values],
+        lambda: {
+            'filter_attrs': get_filteraible_attr_values(plants, excluded_values),
+            'plants_count': filtered_plants.count(),
+        },
+    )
+
+    # Columns with links to sort by them
+    columns = get_list_columns()
+    for column in columns:
+        column['sort'] = get_sort_link(request, sort, column['key'])
 
     # Template data
     context = {
-        'rich_plants': rich_plants, 
-        'attrs_titles': attrs_titles_with_transl,
+        'plant_rows': plant_rows, 
+        'next_url': next_url,
+        'stream_url': stream_url,
+        'streaming': streaming,
+        'sort': sort,
+        'columns': columns,
+        'uid_sort': get_sort_link(request, sort, 'uid'),
         'attrs_not_showing': attrs_not_showing,
         #'title': _('ListOfPlants'),
         'section_name': section_name,
         'user_name': user_name,
         'is_owner': is_owner,
         'brcr_data': brcr.data,
-        'filter_attrs': filter_data,
+        'filter_attrs': summary['filter_attrs'],
+        'plants_count': summary['plants_count'],
     }
     template = loader.get_template('plants/index.html')
+    if streaming:
+        # page is rendered now to set cookies (csrf) before the response starts
+        head, foot = template.render(context, request).split(PLANT_ROWS_MARKER)
+        rows = stream_plant_rows(request, get_sorted_plants(filtered_plants, sort), attrs_not_showing)
+        return StreamingHttpResponse(itertools.chain([head], rows, [foot]))
+    return HttpResponse(template.render(context, request))
+
+
+def stream_plant_rows(request, plants, attrs_not_showing, chunk_size=500):
+    """Rendered table rows of plants, chunk by chunk"""
+    template = loader.get_template('plants/index_rows.html')
+    plant_rows = []
+    for plant_row in PlantRow.iterate(plants):
+        plant_rows.append(plant_row)
+        if len(plant_rows) == chunk_size:
+            yield template.render({'plant_rows': plant_rows, 'attrs_not_showing': attrs_not_showing}, request)
+            plant_rows = []
+    if plant_rows:
+        yield template.render({'plant_rows': plant_rows, 'attrs_not_showing': attrs_not_showing}, request)
+
+
+def search(request):
+    """Full-text search of plants visible to user"""
+    query = request.GET.get('q', '').strip()
+    plant_rows = search_plant_rows(get_plant_permissions(request).visible_plants(), query) if query else []
+
+    brcr = BrCr()
+    # Translators: Section name
+    section_name = _('Search')
+    brcr.add_level(True, '', section_name)
+
+    context = {
+        'plant_rows': plant_rows,
+        'query': query,
+        'section_name': section_name,
+        'brcr_data': brcr.data,
+    }
+    template = loader.get_template('plants/search.html')
     return HttpResponse(template.render(context, request))
 
 
+@login_required
+def export(request):
+    """Download of the whole user collection, `format` is csv or jsonl, `logs=1` adds timelines"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise Http404("Unknown export format")
+    with_logs = request.GET.get('logs') == '1'
+
+    plants = get_user_plants(request.user.id)
+    response = StreamingHttpResponse(
+        export_plants(plants, export_format, with_logs),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    filename = f'plants_{request.user.username}_{timezone.localdate().isoformat()}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 def groups(request, user_id=None):
     """ Groups of user plants: genuses, tags, etc. """
 
@@ -116,7 +254,8 @@ def groups(request, user_id=None):
         current_user = request.user
         if current_user.is_authenticated:
             user_id = current_user.id
-            rich_plants = get_user_richplants(user_id)
+            access = []
+            plants = get_user_plants(user_id)
 
             # # Translators: Section name
             # section_name = _('MyPlants')
@@ -132,118 +271,29 @@ def groups(request, user_id=None):
     else:
         target_user = get_object_or_404(User, id=user_id)
         current_user = request.user
-        tags = Tag.objects.filter(entry__user=current_user)
         # for friend
-        if current_user.is_authenticated and is_friend(current_user, target_user):
+        if get_plant_permissions(request).is_friend_of(target_user.id):
             access = [Plant.AccessTypeChoices.PUBLIC, Plant.AccessTypeChoices.FRIENDS]
-            rich_plants = get_user_richplants(user_id, access)
+            plants = get_user_plants(user_id, access)
         # for anonymous
         else:
             access = [Plant.AccessTypeChoices.PUBLIC,]
-            rich_plants = get_user_richplants(user_id, access)
+            plants = get_user_plants(user_id, access)
 
         # section_name = _('PlantsOfUser') 
         user_name = target_user.username
         # is_owner = False
         # brcr.add_level(True, '', f'{section_name}: {user_name}')
 
-    # make dic of available genuses and count plants
-    genuses_plants = {}
-    genuses_seeds =  {}
-    tags_plants = {}
-    tags_seeds =  {}
-
-    for rp in rich_plants:
-        # genuses 
-        genus = rp.attrs.genus
-        genus = genus.lower() if genus else 'None'
-        
-        #print(rp.is_seed)
-
-        # for seed section 
-        if rp.is_seed:
-            # genuses
-            if genus in genuses_seeds:  
-                genuses_seeds[genus] += 1
-            else: 
-                genuses_seeds[genus] = 1
-
-            # tags
-            for tag in rp.Plant.tags.values():
-                if tag['id'] in tags_seeds:
-                    tags_seeds[tag['id']] += 1
-                else:
-                    tags_seeds[tag['id']] = 1
-        
-        # for plant section 
-        else:
-            # genuses
-            if genus in genuses_plants:  
-                genuses_plants[genus] += 1
-            else: 
-                genuses_plants[genus] = 1
-
-            # tags
-            for tag in rp.Plant.tags.values():
-                if tag['id'] in tags_plants:
-                    tags_plants[tag['id']] += 1
-                else:
-                    tags_plants[tag['id']] = 1
-
-    # TODO why here empty genus? 
-    try:
-        genuses_plants.pop('None')
-        genuses_seeds.pop('None')
-    except:
-        pass
-
-    #print(genuses_seeds)
-
-    # convert genuses dic to list of objects
-    genuses_plant_objects = []
-    for genus in genuses_plants: 
-        genus_obj = GenusForGroups()
-        genus_obj.name = genus
-        genus_obj.number = genuses_plants[genus]
-        genuses_plant_objects.append(genus_obj)
-
-    genuses_seed_objects = []
-    for genus in genuses_seeds: 
-        genus_obj = GenusForGroups()
-        genus_obj.name = genus
-        genus_obj.number = genuses_seeds[genus]
-        genuses_seed_objects.append(genus_obj)
-
-
-    # convert tags dic to list of objects
-    tag_plant_objects = []
-    for tag_id in tags_plants:
-        tag = Tag.objects.get(id=tag_id)
-        tag_obj = TagForGroups()
-        tag_obj.name = tag.name
-        tag_obj.id = tag.id
-        tag_obj.number = tags_plants[tag_id]
-        tag_plant_objects.append(tag_obj)
-
-    tag_seed_objects = []
-    for tag_id in tags_seeds:
-        tag = Tag.objects.get(id=tag_id)
-        tag_obj = TagForGroups()
-        tag_obj.name = tag.name
-        tag_obj.id = tag.id
-        tag_obj.number = tags_seeds[tag_id]
-        tag_seed_objects.append(tag_obj)
-
-    # sorted by name
-    genuses_plant_objects_sorted = sorted(genuses_plant_objects, key=lambda x: x.name, reverse=False)
-    genuses_seed_objects_sorted = sorted(genuses_seed_objects, key=lambda x: x.name, reverse=False)
+    # genuses and tags with number of plants, sorted by name
+    plant_groups = get_cached_summary(user_id, 'groups', [access], lambda: get_plant_groups(plants))
 
     # Template data
     context = {
-        'genuses': genuses_plant_objects_sorted, 
-        'tags': tag_plant_objects,
-        'seeds_genuses': genuses_seed_objects_sorted,
-        'seeds_tags': tag_seed_objects,
+        'genuses': plant_groups['genuses'], 
+        'tags': plant_groups['tags'],
+        'seeds_genuses': plant_groups['seeds_genuses'],
+        'seeds_tags': plant_groups['seeds_tags'],
         'user_name': user_name,
         #'title': _('Plants grouped:'),
         #'brcr_data': brcr.data,
@@ -258,40 +308,13 @@ def plant_view(request, plant_id):
     # try to get plant by id
     target_plant = get_object_or_404(Plant, id=plant_id)
     if target_plant:
-        plant_access = target_plant.access_type
-        target_rich_plant = RichPlant(target_plant)
-
-        # authenticated
+        # access by plant access type: public, for friends or private
+        permissions = get_plant_permissions(request)
+        if not permissions.can_view(target_plant):
+            raise PermissionDenied
+        is_owner = permissions.can_edit(target_plant)
+        rich_plant = RichPlant(target_plant)
         current_user = request.user
-        if current_user.is_authenticated: 
-            user_is_owner = check_is_user_owner_of_plant(current_user, target_rich_plant)
-            user_is_friend = check_is_user_friend_of_plant_owner(current_user, target_rich_plant)
-            is_owner = user_is_owner
-
-            # plant is public
-            if plant_access == Plant.AccessTypeChoices.PUBLIC:
-                rich_plant = target_rich_plant
-
-            # plant is friends only
-            elif plant_access == Plant.AccessTypeChoices.FRIENDS and (user_is_friend or user_is_owner):
-                rich_plant = target_rich_plant
-
-            # plant is privat
-            elif plant_access == Plant.AccessTypeChoices.PRIVATE and user_is_owner:
-                rich_plant = target_rich_plant
-                
-            else:
-                raise PermissionDenied
-        
-        # anonymous
-        else:
-            is_owner = False
-            
-            # plant is public
-            if plant_access == Plant.AccessTypeChoices.PUBLIC:
-                rich_plant = target_rich_plant
-            else:
-                raise PermissionDenied
 
         # User name
         user_name = current_user.username
@@ -310,6 +333,9 @@ def plant_view(request, plant_id):
         plant_serialized = PlantSerializer(target_plant).data
         user_serialized = UserSerializer(current_user).data
 
+        # older logs are loaded by api while scrolling
+        timeline_cards, timeline_cursor = get_plant_timeline_page(target_plant)
+
         # Template data
         context = {
             'plant': rich_plant,
@@ -319,6 +345,8 @@ def plant_view(request, plant_id):
             'brcr_data': brcr.data,
             'plant_serialized': plant_serialized,
             'user_serialized': user_serialized,
+            'timeline_cards': timeline_cards,
+            'timeline_cursor': timeline_cursor,
         }
         template = loader.get_template('plants/view.html')
         return HttpResponse(template.render(context, request))
@@ -380,18 +408,16 @@ def edit_plant_attr(request, plant_id=None, attr_key=None):
 
     # try to get plant by id
     target_plant = get_object_or_404(Plant, id=plant_id)
-    target_rich_plant = RichPlant(target_plant)
     
     # check access (is owner?)
-    user_is_owner = check_is_user_owner_of_plant(current_user, target_rich_plant)
-    if not user_is_owner:
+    if not get_plant_permissions(request).can_edit(target_plant):
         return HttpResponseForbidden()
     
     # processing user data
     if request.method == 'POST':
 
         # check if attr key exist
-        if attr_key in Attribute.keys.get_all_keys():
+        if attr_key in get_attribute_schema().keys:
             new_value = request.POST[attr_key]
 
             # create log
@@ -404,8 +430,8 @@ def edit_plant_attr(request, plant_id=None, attr_key=None):
         return redirect('plant_view', plant_id=plant_id)
 
     else:
-        value = target_rich_plant.attrs_as_dic[attr_key]
-        attr = Attribute.objects.get(key=attr_key)
+        value = RichPlant(target_plant).attrs_as_dic[attr_key]
+        attr = get_attribute_schema().by_key[attr_key]
         label = attr.name
         max_length = attr.max_text_length 
         type = attr.value_type
@@ -434,21 +460,19 @@ def add_plant_action(request, plant_id, action_key):
 
     # try to get plant by id
     target_plant = get_object_or_404(Plant, id=plant_id)
-    target_rich_plant = RichPlant(target_plant)
 
     # try to get action by key
     action = get_object_or_404(Action, key=action_key)
 
     # check access (is owner?)
-    user_is_owner = check_is_user_owner_of_plant(current_user, target_rich_plant)
-    if not user_is_owner:
+    if not get_plant_permissions(request).can_edit(target_plant):
         return HttpResponseForbidden()
 
      # processing user data
     if request.method == 'POST':
 
         # check if attr key exist
-        if action_key in Action.keys.get_all_keys():
+        if action_key in get_attribute_schema().actions:
             # get comment
             comment = request.POST['comment']
 
@@ -457,30 +481,33 @@ def add_plant_action(request, plant_id, action_key):
                 'comment': comment,
             }
 
-            # create log
-            create_log(
+            # prepare log
+            logs = [prepare_log(
                 Log.ActionChoices.ADDITION,
                 current_user,
                 target_plant,
                 data
-            )
+            )]
 
             # process related attributes if they recieved
             related_attr_data = {}
 
-            for attr_key in Attribute.keys.get_all_keys():
+            for attr_key in get_attribute_schema().keys:
                 if attr_key in request.POST:
                     related_attr_data[attr_key] = request.POST[attr_key]
 
             if related_attr_data:
 
-                # create log
-                create_log(
+                # prepare log
+                logs.append(prepare_log(
                     Log.ActionChoices.CHANGE,
                     current_user,
                     target_plant,
                     related_attr_data
-                )
+                ))
+
+            # care event may wait in the spool if it doesn't come with attribute changes
+            create_logs(logs, write_behind=True)
             
             return redirect('plant_view', plant_id=plant_id)
 
@@ -494,12 +521,14 @@ def add_plant_action(request, plant_id, action_key):
                 Log.ActionChoices.ADDITION,
                 current_user,
                 target_plant,
-                {'action': action_key}
+                {'action': action_key},
+                write_behind=True,
             )
             
             return redirect('plant_view', plant_id=plant_id)
 
     else:
+        target_rich_plant = RichPlant(target_plant)
         form = ActionForm(action, target_rich_plant)
 
     # Template data
@@ -524,11 +553,9 @@ def upload_photo(request, plant_id):
 
     # try to get plant by id
     target_plant = get_object_or_404(Plant, id=plant_id)
-    target_rich_plant = RichPlant(target_plant)
 
     # check access (is owner?)
-    user_is_owner = check_is_user_owner_of_plant(current_user, target_rich_plant)
-    if not user_is_owner:
+    if not get_plant_permissions(request).can_edit(target_plant):
         return HttpResponseForbidden()
 
     if request.method == 'POST':
@@ -579,7 +606,7 @@ def upload_photo(request, plant_id):
     # Template data
     template = loader.get_template('plants/upload_photo.html')
     context = {
-        'plant': target_rich_plant,
+        'plant': RichPlant(target_plant),
     }
     return HttpResponse(template.render(context, request))
 
@@ -611,6 +638,7 @@ def upload_photo_decode_matrix(request):
         puids = detect_data_matrix(image_file)
         if len(puids) > 0:
             rich_plants = []
+            logs = []
             for puid in puids:
 
                 # try to get plant by puid
@@ -623,8 +651,7 @@ def upload_photo_decode_matrix(request):
                 rich_plant = RichPlant(plant)
 
                 # check access (is owner?)
-                user_is_owner = check_is_user_owner_of_plant(current_user, rich_plant)
-                if not user_is_owner:
+                if not get_plant_permissions(request).can_edit(plant):
                     messages.append(f'{current_user.username} is not the owner of plant with PUID: {puid}')
                     break
 
@@ -646,19 +673,22 @@ def upload_photo_decode_matrix(request):
                     image_url = fs.url(filename)
                     photo_id = None
 
-                # create log
+                # prepare log
                 photo_description = 'Autodetected photo.'
                 if 'position_clarifications' in puid:
                     photo_description += ' Data matrix position calrification: '
                     for line in puid['position_clarifications']:
                         photo_description += ' ' + line
-                create_log(
+                logs.append(prepare_log(
                     Log.ActionChoices.ADDITION,
                     current_user,
                     plant,
                     {'action': 'add_photo', 'photo_url': image_url, 'photo_id':photo_id, 'photo_description': photo_description},
                     action_time = photo_datetime
-                )
+                ))
+
+            # logs of all detected plants are written together
+            create_logs(logs)
             context['rich_plants'] = rich_plants
         else: 
             messages.append('Plant identification was failed')
@@ -684,8 +714,7 @@ def set_profile_img(request, plant_id, photo_id=None):
     target_rich_plant = RichPlant(target_plant)
 
     # check access (is owner?)
-    user_is_owner = check_is_user_owner_of_plant(current_user, target_rich_plant)
-    if not user_is_owner:
+    if not get_plant_permissions(request).can_edit(target_plant):
         return HttpResponseForbidden()
 
     if photo_id:
@@ -0,0 +1,23 @@
+/* Next pages of the plant list are appended to the table */
+var load_more_button = document.getElementById('loadMorePlants');
+
+if (load_more_button) {
+  load_more_button.addEventListener('click', async function(e) {
+    e.preventDefault();
+    if (load_more_button.classList.contains('disabled')) {
+      return;
+    }
+    load_more_button.classList.add('disabled');
+    const next_page_url = load_more_button.getAttribute('href') + '&fragment=rows';
+    await axios.get(next_page_url).then((resp) => {
+      document.getElementById('plantRows').insertAdjacentHTML('beforeend', resp.data);
+      const next_url = resp.headers['x-next-page'];
+      if (next_url) {
+        load_more_button.setAttribute('href', next_url);
+        load_more_button.classList.remove('disabled');
+      } else {
+        load_more_button.remove();
+      }
+    });
+  });
+}
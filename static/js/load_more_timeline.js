@@ -0,0 +1,70 @@
+/* Older logs of the plant timeline are appended while scrolling */
+var load_older_button = document.getElementById('loadOlderLogs');
+
+function fill_timeline_card(card) {
+  const template = document.getElementById('timelineCardTemplate');
+  const row = template.content.firstElementChild.cloneNode(true);
+  const field = (name) => row.querySelector(`[data-field="${name}"]`);
+
+  row.dataset.logId = card.id;
+  field('action_time').textContent = card.action_time_display;
+  field('title').textContent = card.title;
+  if (card.subtitle) {
+    field('subtitle').textContent = card.subtitle;
+    field('subtitle').classList.remove('d-none');
+  }
+  if (card.img_url) {
+    field('img').src = card.img_url;
+    field('img').alt = card.img_alt || '';
+    field('img').classList.remove('d-none');
+  }
+  if (card.text) {
+    field('text').textContent = card.text;
+    field('text').classList.remove('d-none');
+  }
+  for (const [key, value] of Object.entries(card.attrs)) {
+    const item = document.createElement('li');
+    item.className = 'list-group-item';
+    const name = document.createElement('b');
+    name.textContent = key;
+    item.append(name, `: ${value}`);
+    field('attrs').append(item);
+  }
+  return row;
+}
+
+async function load_older_logs() {
+  if (load_older_button.classList.contains('disabled')) {
+    return;
+  }
+  load_older_button.classList.add('disabled');
+  const params = {cursor: load_older_button.dataset.cursor};
+  await axios.get(load_older_button.dataset.url, {params: params}).then((resp) => {
+    const timeline = document.getElementById('timeline');
+    for (const card of resp.data.cards) {
+      timeline.append(fill_timeline_card(card));
+    }
+    if (resp.data.next_cursor) {
+      load_older_button.dataset.cursor = resp.data.next_cursor;
+      load_older_button.classList.remove('disabled');
+    } else {
+      load_older_button.remove();
+      observer.disconnect();
+    }
+  });
+}
+
+if (load_older_button) {
+  load_older_button.addEventListener('click', function(e) {
+    e.preventDefault();
+    load_older_logs();
+  });
+
+  // next page is loaded when the button is scrolled into view
+  var observer = new IntersectionObserver((entries) => {
+    if (entries.some((entry) => entry.isIntersecting)) {
+      load_older_logs();
+    }
+  });
+  observer.observe(load_older_button);
+}
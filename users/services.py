@@ -2,7 +2,4 @@ from .models import User
 
 
 def is_friend(user_requester, user_target):
-    if user_requester in user_target.friends.all():
-        return True
-    else:
-        return False
\ No newline at end of file
+    return user_target.friends.filter(id=user_requester.id).exists()
\ No newline at end of file